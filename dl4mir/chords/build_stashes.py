@@ -0,0 +1,163 @@
+"""Build chord Stashes directly from audio, in a single pass.
+
+Each track is streamed through the CQT, LCN and label interpolation in one
+worker, and the result is appended to every fold / split Stash containing it,
+without writing intermediate feature files (unless asked to).
+
+Sample Call:
+$ python build_stashes.py \
+data_splits.json \
+audio/ \
+references/ \
+biggie/chords_l2n \
+--cqt_params=cqt_params.json \
+--lcn_dims 21 11 \
+--num_cpus=4
+"""
+
+import argparse
+import json
+import numpy as np
+import biggie
+from os import path
+from sklearn.externals.joblib import Parallel, delayed
+import time
+
+from dl4mir.common.cqt import cqt
+import dl4mir.common.featurestore as fstore
+import dl4mir.common.fileutil as futils
+from dl4mir.common.lcn import create_kernel
+from dl4mir.common.lcn import lcn_octaves
+from dl4mir.chords.file_importer import interpolate_chord_labels
+
+# fold / split
+FILE_FMT = "%s/%s.hdf5"
+JAMS_EXT = "jams"
+
+
+def compute_chord_fields(audio_file, jams_file, cqt_params, lcn_kernel,
+                         feature_file=None, dtype=np.float32):
+    """Compute the fields of a chord entity from an audio file.
+
+    Parameters
+    ----------
+    audio_file: str
+        Path to an audio file.
+    jams_file: str
+        Path to a corresponding JAMS file.
+    cqt_params: dict
+        Keyword arguments for `dl4mir.common.cqt.cqt`.
+    lcn_kernel: np.ndarray
+        Kernel for `lcn_octaves`, or None to skip LCN.
+    feature_file: str, default=None
+        If given, also save the {cqt, time_points} features here.
+    dtype: type
+        Data type for the cqt array.
+
+    Returns
+    -------
+    fields: dict
+        Arrays for {cqt, time_points, chord_labels}.
+    """
+    time_points, cqt_spectra = cqt(audio_file, **cqt_params)
+    cqt_spectra = cqt_spectra.astype(dtype)
+    if lcn_kernel is not None:
+        cqt_spectra = lcn_octaves(cqt_spectra, lcn_kernel)
+    if feature_file:
+        fstore.save(feature_file, time_points=time_points, cqt=cqt_spectra)
+
+    chord_labels = interpolate_chord_labels(jams_file, time_points)
+    return dict(cqt=cqt_spectra, time_points=time_points,
+                chord_labels=chord_labels)
+
+
+def stash_membership(data_splits):
+    """Map each key to the (fold, split) pairs it belongs to.
+
+    Parameters
+    ----------
+    data_splits: dict
+        Keys of each split of each fold, as {fold: {split: [keys]}}.
+
+    Returns
+    -------
+    membership: dict
+        List of (fold, split) tuples, under each key.
+    """
+    membership = dict()
+    for fold in data_splits:
+        for split in data_splits[fold]:
+            for key in data_splits[fold][split]:
+                membership.setdefault(key, []).append((fold, split))
+    return membership
+
+
+def main(args):
+    """Main routine for building the stashes."""
+    data_splits = json.load(open(args.split_file))
+    cqt_params = json.load(open(args.cqt_params)) if args.cqt_params else {}
+    lcn_kernel = create_kernel(*args.lcn_dims) if args.lcn_dims else None
+    if args.feature_directory:
+        futils.create_directory(args.feature_directory)
+
+    output_file_fmt = path.join(args.output_directory, FILE_FMT)
+    stashes = dict()
+    for fold in data_splits:
+        for split in data_splits[fold]:
+            output_file = output_file_fmt % (fold, split)
+            futils.create_directory(path.split(output_file)[0])
+            stashes[(fold, split)] = biggie.Stash(output_file)
+
+    membership = stash_membership(data_splits)
+    keys = sorted(membership.keys())
+    pool = Parallel(n_jobs=args.num_cpus)
+    dfx = delayed(compute_chord_fields)
+    for idx in range(0, len(keys), args.batch_size):
+        batch = keys[idx:idx + args.batch_size]
+        results = pool(dfx(
+            path.join(args.audio_directory, "%s.%s" % (key, args.audio_ext)),
+            path.join(args.jams_directory, "%s.%s" % (key, JAMS_EXT)),
+            cqt_params, lcn_kernel,
+            feature_file=(path.join(args.feature_directory,
+                                    "%s.%s" % (key, fstore.EXT))
+                          if args.feature_directory else None))
+            for key in batch)
+        for count, (key, fields) in enumerate(zip(batch, results), idx):
+            entity = biggie.Entity(**fields)
+            for fold_split in membership[key]:
+                stashes[fold_split].add(key, entity)
+            print "[%s] %12d / %12d: %s" % (
+                time.asctime(), count, len(keys), key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build chord Stashes from audio in a single pass.")
+    parser.add_argument("split_file",
+                        metavar="split_file", type=str,
+                        help="Path to splits of the data as JSON.")
+    parser.add_argument("audio_directory",
+                        metavar="audio_directory", type=str,
+                        help="Directory containing audio files.")
+    parser.add_argument("jams_directory",
+                        metavar="jams_directory", type=str,
+                        help="Directory containing reference JAMS files.")
+    parser.add_argument("output_directory",
+                        metavar="output_directory", type=str,
+                        help="Base directory for the output files.")
+    parser.add_argument("--audio_ext", type=str, default="wav",
+                        help="File extension of the audio files.")
+    parser.add_argument("--cqt_params", type=str, default='',
+                        help="Path to a JSON file of CQT parameters.")
+    parser.add_argument("--lcn_dims", type=int, nargs=2, default=None,
+                        metavar=("dim0", "dim1"),
+                        help="Dimensions of the LCN kernel; if not given, "
+                             "LCN is skipped.")
+    parser.add_argument("--feature_directory", type=str, default='',
+                        help="If given, also save the features (npyd) here.")
+    parser.add_argument("--batch_size", type=int, default=32,
+                        help="Number of tracks computed between writes.")
+    parser.add_argument("--num_cpus", type=int, default=-1,
+                        help="Number of CPUs over which to parallelize "
+                             "computations.")
+    main(parser.parse_args())
@@ -1,5 +1,8 @@
 import itertools
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
+import os
+import tempfile
 
 import biggie
 import pescador
@@ -7,6 +10,7 @@ import mir_eval
 from dl4mir.chords import labels as L
 import dl4mir.chords.pipefxs as FX
 from dl4mir.common import util
+import dl4mir.common.fileutil as futil
 import dl4mir.chords.lexicon as lex
 
 
@@ -33,7 +37,7 @@ def slice_cqt_entity(entity, length, idx=None):
         The windowed chord observation.
     """
     idx = np.random.randint(entity.cqt.shape[1]) if idx is None else idx
-    cqt = np.array([util.slice_tile(x, idx, length) for x in entity.cqt])
+    cqt = util.cqt_tile(entity, idx, length)
     return biggie.Entity(data=cqt, chord_label=entity.chord_labels[idx])
 
 
@@ -56,7 +60,7 @@ def slice_note_entity(entity, length, idx=None):
         The windowed chord observation.
     """
     idx = np.random.randint(entity.cqt.shape[1]) if idx is None else idx
-    cqt = np.array([util.slice_tile(x, idx, length) for x in entity.cqt])
+    cqt = util.cqt_tile(entity, idx, length)
     return biggie.Entity(data=cqt, note_numbers=entity.note_numbers[idx])
 
 
@@ -110,7 +114,7 @@ def chord_sampler(key, stash, win_length=20, index=None, max_samples=None,
     sample: biggie.Entity with fields {cqt, chord_label}
         The windowed chord observation.
     """
-    entity = stash.get(key)
+    entity = util.pad_cqt_entity(stash.get(key), win_length)
     has_labels = hasattr(entity, 'chord_labels')
     label_key = 'note_numbers' if not has_labels else 'chord_labels'
     num_samples = len(getattr(entity, label_key))
@@ -176,7 +180,7 @@ def lazy_cqt_buffer(key, stash, win_length=20, index=None):
     sample: biggie.Entity with fields {cqt, chord_label}
         The windowed chord observation.
     """
-    entity = stash.get(key)
+    entity = util.pad_cqt_entity(stash.get(key), win_length)
     num_samples = len(entity.chord_labels)
     if index is None:
         index = {key: np.arange(num_samples)}
@@ -198,12 +202,133 @@ def map_bigrams(entity, lexicon):
     return lexicon.label_to_index(entity.bigrams)
 
 
+def chord_index_file(stash_file):
+    """Return the path of the chord-index sidecar next to a stash file."""
+    return "%s.chord_index.npz" % os.path.splitext(stash_file)[0]
+
+
+def lexicon_key(lexicon, index_mapper=map_chord_labels):
+    """Return a string identifying a lexicon and label mapping function."""
+    return "%s-%d-%s" % (lexicon.__class__.__name__, lexicon.num_classes,
+                         index_mapper.__name__)
+
+
+def save_chord_index(index_file, partition_labels, num_classes,
+                     checksum='', lexicon_key=''):
+    """Write partition labels and per-class frame counts to disk.
+
+    Parameters
+    ----------
+    index_file : str
+        Path to an .npz file for writing; replaced atomically.
+    partition_labels : dict
+        Arrays of class indices, under the keys of a stash. Unmapped frames
+        (None) are stored as -1.
+    num_classes : int
+        Number of classes to count.
+    checksum : str
+        Checksum of the stash file the labels were computed from.
+    lexicon_key : str
+        Identifier of the lexicon used to compute the labels.
+    """
+    keys = sorted(partition_labels.keys())
+    labels = [np.array([-1 if l is None else l
+                        for l in partition_labels[k]], dtype=int)
+              for k in keys]
+    lengths = np.array([len(l) for l in labels], dtype=int)
+    labels = np.concatenate(labels) if labels else np.zeros(0, dtype=int)
+    counts = np.bincount(labels[labels >= 0], minlength=num_classes)
+    fd, tmp_file = tempfile.mkstemp(
+        suffix='.npz', dir=os.path.dirname(os.path.abspath(index_file)))
+    with os.fdopen(fd, 'wb') as fh:
+        np.savez(fh, keys=np.array(keys, dtype=str), lengths=lengths,
+                 labels=labels, counts=counts, checksum=checksum,
+                 lexicon_key=lexicon_key)
+    os.rename(tmp_file, index_file)
+
+
+def read_chord_index(index_file):
+    """Read the arrays of a chord-index sidecar, closing the file.
+
+    Parameters
+    ----------
+    index_file : str
+        Path to an .npz file, as written by `save_chord_index`.
+
+    Returns
+    -------
+    data : dict of np.ndarrays
+        Arrays of the sidecar, under their names.
+    """
+    npz_file = np.load(index_file)
+    try:
+        return dict([(k, npz_file[k]) for k in npz_file.files])
+    finally:
+        npz_file.close()
+
+
+def load_chord_index(stash_file, lexicon, index_mapper=map_chord_labels,
+                     stash=None):
+    """Return the partition labels of a stash, using its chord-index sidecar.
+
+    The sidecar is (re)built from the stash if it is missing, or if the stash
+    checksum or lexicon it was computed with no longer match.
+
+    Parameters
+    ----------
+    stash_file : str
+        Path to a biggie Stash file.
+    lexicon : lexicon.Lexicon
+        Instantiated chord lexicon for mapping labels to indices.
+    index_mapper : function
+        Maps entities and the lexicon to arrays of class indices.
+    stash : biggie.Stash, default=None
+        Opened stash for `stash_file`, used if the index must be rebuilt.
+
+    Returns
+    -------
+    partition_labels : dict
+        Arrays of class indices, under the keys of the stash; -1 for frames
+        that don't map into the lexicon.
+    counts : np.ndarray, shape=(lexicon.num_classes,)
+        Number of frames of each class.
+    """
+    index_file = chord_index_file(stash_file)
+    checksum = futil.checksum(stash_file)
+    key = lexicon_key(lexicon, index_mapper)
+    data = read_chord_index(index_file) if os.path.exists(index_file) else None
+    if data is None or str(data['checksum']) != checksum or \
+            str(data['lexicon_key']) != key:
+        if stash is None:
+            stash = biggie.Stash(stash_file)
+        partition_labels = util.partition(stash, index_mapper, lexicon)
+        save_chord_index(index_file, partition_labels, lexicon.num_classes,
+                         checksum, key)
+        data = read_chord_index(index_file)
+
+    labels = np.split(data['labels'], np.cumsum(data['lengths'])[:-1])
+    keys = [str(k) for k in data['keys']]
+    return dict(zip(keys, labels)), data['counts']
+
+
+def partition_chord_labels(stash, lexicon, index_mapper=map_chord_labels,
+                           stash_file=None):
+    """Partition a stash by chord class, from its sidecar if a file is given.
+
+    See `load_chord_index` for details.
+    """
+    if stash_file is None:
+        return util.partition(stash, index_mapper, lexicon)
+    return load_chord_index(stash_file, lexicon, index_mapper, stash)[0]
+
+
 def create_chord_index_stream(stash, win_length, lexicon,
                               index_mapper=map_chord_labels,
                               sample_func=slice_cqt_entity,
                               pitch_shift_func=FX.pitch_shift_cqt,
                               max_pitch_shift=0, working_size=50,
-                              partition_labels=None, valid_idx=None):
+                              partition_labels=None, valid_idx=None,
+                              stash_file=None):
     """Return an unconstrained stream of chord samples with class indexes.
 
     Parameters
@@ -219,7 +344,9 @@ def create_chord_index_stream(stash, win_length, lexicon,
     pitch_shift : int
         Maximum number of semitones (+/-) to rotate an observation.
     partition_labels : dict
-
+    stash_file : str, default=None
+        Path of `stash`; if given, partition labels are read from its
+        chord-index sidecar (see `load_chord_index`).
 
     Returns
     -------
@@ -227,7 +354,8 @@ def create_chord_index_stream(stash, win_length, lexicon,
         Data stream of windowed chord entities.
     """
     if partition_labels is None:
-        partition_labels = util.partition(stash, index_mapper, lexicon)
+        partition_labels = partition_chord_labels(
+            stash, lexicon, index_mapper, stash_file)
 
     if valid_idx is None:
         valid_idx = range(lexicon.num_classes)
@@ -245,6 +373,212 @@ def create_chord_index_stream(stash, win_length, lexicon,
     return FX.map_to_class_index(stream, index_mapper, lexicon)
 
 
+def chord_index_table(partition_labels, valid_idx):
+    """Flatten partition labels into a table of (entity, frame, class) rows.
+
+    Parameters
+    ----------
+    partition_labels : dict
+        Arrays of class indices, under the keys of a stash.
+    valid_idx : array_like
+        Class indices to keep.
+
+    Returns
+    -------
+    keys : list
+        Keys of the entities with at least one valid frame, in table order.
+    table : np.ndarray, shape=(num_rows, 3)
+        Integer rows of (index into `keys`, frame index, class index).
+    """
+    index = util.index_partition_arrays(partition_labels, valid_idx)
+    keys = sorted(index.keys())
+    table = [np.array([np.zeros(len(index[k]), dtype=int) + n, index[k],
+                       np.asarray(partition_labels[k])[index[k]]],
+                      dtype=int).T
+             for n, k in enumerate(keys)]
+    if not table:
+        return keys, np.zeros([0, 3], dtype=int)
+    return keys, np.concatenate(table, axis=0)
+
+
+def uniform_entity_sampler(table):
+    """Create a sampler of table rows with uniform entity presentation.
+
+    Rows are drawn by picking an entity uniformly, then one of its frames;
+    this matches the weighting of `create_chord_index_stream`, which draws
+    about as many samples from each entity regardless of its length.
+
+    Parameters
+    ----------
+    table : np.ndarray, shape=(num_rows, 3)
+        Rows of (entity, frame, class), as from `chord_index_table`.
+
+    Returns
+    -------
+    sample_rows : function
+        Maps a number of draws to an array of row indices into `table`.
+    """
+    order = np.argsort(table[:, 0], kind='mergesort')
+    entities = table[order, 0]
+    is_start = np.ones(len(entities), dtype=bool)
+    is_start[1:] = entities[1:] != entities[:-1]
+    entity_starts = np.flatnonzero(is_start)
+    entity_lengths = np.diff(np.append(entity_starts, len(entities)))
+
+    def sample_rows(num_draws):
+        eidx = np.random.randint(len(entity_starts), size=num_draws)
+        ridx = entity_starts[eidx] + (np.random.uniform(
+            size=num_draws) * entity_lengths[eidx]).astype(int)
+        return order[ridx]
+
+    return sample_rows
+
+
+def uniform_class_sampler(table):
+    """Create a sampler of table rows with uniform class presentation.
+
+    Rows are drawn by picking a class uniformly, then a key uniformly among
+    those containing that class, then one of its frames of that class.
+
+    Parameters
+    ----------
+    table : np.ndarray, shape=(num_rows, 3)
+        Rows of (entity, frame, class), as from `chord_index_table`.
+
+    Returns
+    -------
+    sample_rows : function
+        Maps a number of draws to an array of row indices into `table`.
+    """
+    # Inverted index: rows grouped by class, then by entity.
+    order = np.lexsort((table[:, 1], table[:, 0], table[:, 2]))
+    groups = table[order][:, [2, 0]]
+    is_start = np.ones(len(groups), dtype=bool)
+    is_start[1:] = np.any(groups[1:] != groups[:-1], axis=1)
+    group_starts = np.flatnonzero(is_start)
+    group_lengths = np.diff(np.append(group_starts, len(groups)))
+
+    group_classes = groups[group_starts, 0]
+    is_start = np.ones(len(group_classes), dtype=bool)
+    is_start[1:] = group_classes[1:] != group_classes[:-1]
+    class_starts = np.flatnonzero(is_start)
+    class_lengths = np.diff(np.append(class_starts, len(group_classes)))
+
+    def sample_rows(num_draws):
+        cidx = np.random.randint(len(class_starts), size=num_draws)
+        gidx = class_starts[cidx] + (
+            np.random.uniform(size=num_draws) * class_lengths[cidx]).astype(int)
+        ridx = group_starts[gidx] + (
+            np.random.uniform(size=num_draws) * group_lengths[gidx]).astype(int)
+        return order[ridx]
+
+    return sample_rows
+
+
+def stack_padded_cqts(stash, keys, win_length):
+    """Pad each entity's CQT once and stack them along the time axis.
+
+    Parameters
+    ----------
+    stash : dict_like
+        Dict or biggie.Stash of chord entities.
+    keys : list
+        Keys of the entities to stack.
+    win_length : int
+        Length of the windows that will be sliced.
+
+    Returns
+    -------
+    frames : np.ndarray, shape=(num_frames, num_channels, num_bins)
+        Padded CQTs, concatenated in the order of `keys`.
+    offsets : np.ndarray, shape=(len(keys),)
+        Row in `frames` of the window centered on frame 0 of each entity.
+    """
+    padded = [util.pad_tiles(np.asarray(stash.get(k).cqt), win_length, axis=1)
+              for k in keys]
+    lengths = np.array([x.shape[1] for x in padded], dtype=int)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(int)
+    frames = np.concatenate(padded, axis=1).transpose(1, 0, 2)
+    return np.ascontiguousarray(frames), offsets
+
+
+def create_chord_index_batches(stash, win_length, lexicon, batch_size,
+                               index_mapper=map_chord_labels,
+                               partition_labels=None, valid_idx=None,
+                               stash_file=None, sampling='entity'):
+    """Return a stream of minibatches of chord samples with class indexes.
+
+    Unlike `create_chord_index_stream` + `streams.minibatch`, whole batches
+    are drawn at once: frames are sampled from a flat table of (entity, frame)
+    rows, and all windows are gathered in a single operation over the stacked,
+    padded CQTs. Note that this holds every CQT in memory, and that
+    pitch-shifting is not supported.
+
+    Parameters
+    ----------
+    stash : biggie.Stash
+        A collection of chord entities.
+    win_length : int
+        Length of a given tile slice.
+    lexicon : lexicon.Lexicon
+        Instantiated chord lexicon for mapping labels to indices.
+    batch_size : int
+        Number of observations in each batch.
+    partition_labels : dict
+        Precomputed output of `util.partition(stash, index_mapper, lexicon)`.
+    valid_idx : array_like
+        Class indices to sample; defaults to all classes of the lexicon.
+    stash_file : str, default=None
+        Path of `stash`; if given, partition labels are read from its
+        chord-index sidecar (see `load_chord_index`).
+    sampling : str, default='entity'
+        How rows are drawn; one of 'entity', presenting entities uniformly as
+        `create_chord_index_stream` does (see `uniform_entity_sampler`),
+        'class', presenting classes uniformly (see `uniform_class_sampler`),
+        or 'frame', drawing frames uniformly, such that long entities
+        dominate.
+
+    Yields
+    ------
+    batch : dict of np.ndarrays
+        Batch with fields {data, class_idx}, shaped (batch_size, num_channels,
+        win_length, num_bins) and (batch_size,), newly allocated each time.
+    """
+    if partition_labels is None:
+        partition_labels = partition_chord_labels(
+            stash, lexicon, index_mapper, stash_file)
+
+    if valid_idx is None:
+        valid_idx = range(lexicon.num_classes)
+
+    keys, table = chord_index_table(partition_labels, valid_idx)
+    if sampling == 'entity':
+        sample_rows = uniform_entity_sampler(table)
+    elif sampling == 'class':
+        sample_rows = uniform_class_sampler(table)
+    elif sampling == 'frame':
+        def sample_rows(num_draws):
+            return np.random.randint(len(table), size=num_draws)
+    else:
+        raise ValueError("Unknown sampling: %s" % sampling)
+
+    frames, offsets = stack_padded_cqts(stash, keys, win_length)
+    starts = offsets[table[:, 0]] + table[:, 1]
+
+    # Overlapping (num_windows, num_channels, win_length, num_bins) view.
+    num_windows, num_channels, num_bins = frames.shape
+    num_windows -= win_length - 1
+    step, channel_step, bin_step = frames.strides
+    windows = as_strided(
+        frames, shape=(num_windows, num_channels, win_length, num_bins),
+        strides=(step, channel_step, step, bin_step))
+
+    while True:
+        rows = sample_rows(batch_size)
+        yield dict(data=np.take(windows, starts[rows], axis=0),
+                   class_idx=table[rows, 2])
+
+
 def create_target_stream(stash, win_length, working_size=50, max_pitch_shift=0,
                          bins_per_pitch=1, sample_func=slice_cqt_entity,
                          mapper=FX.map_to_chroma):
@@ -281,14 +615,50 @@ def create_target_stream(stash, win_length, working_size=50, max_pitch_shift=0,
     return mapper(stream, bins_per_pitch)
 
 
+def uniform_chord_sampler(stash, win_length, keys, table, chunk_size=256,
+                          sample_func=slice_cqt_entity):
+    """Generator for sampling chord observations with uniform class presentation.
+
+    Draws are made in chunks, loading each entity once per chunk.
+
+    Parameters
+    ----------
+    stash : dict_like
+        Dict or biggie.Stash of chord entities.
+    win_length: int
+        Length of centered observation window for the CQT.
+    keys, table : list, np.ndarray
+        Output of `chord_index_table`.
+    chunk_size : int
+        Number of draws sharing entity loads.
+
+    Yields
+    ------
+    sample: biggie.Entity with fields {cqt, chord_label}
+        The windowed chord observation.
+    """
+    sample_rows = uniform_class_sampler(table)
+    while True:
+        rows = table[sample_rows(chunk_size)]
+        entities = dict([(n, util.pad_cqt_entity(stash.get(keys[n]),
+                                                  win_length))
+                         for n in np.unique(rows[:, 0])])
+        for n, idx, _ in rows:
+            yield sample_func(entities[n], win_length, idx)
+
+
 def create_uniform_chord_index_stream(stash, win_length, lexicon,
                                       index_mapper=map_chord_labels,
                                       sample_func=slice_cqt_entity,
                                       pitch_shift_func=FX.pitch_shift_cqt,
                                       max_pitch_shift=0, working_size=4,
-                                      partition_labels=None, valid_idx=None):
+                                      partition_labels=None, valid_idx=None,
+                                      stash_file=None, chunk_size=256):
     """Return a stream of chord samples, with uniform quality presentation.
 
+    Classes are drawn uniformly, then keys uniformly among those containing
+    the class, then frames of that class; see `uniform_class_sampler`.
+
     Parameters
     ----------
     stash : biggie.Stash
@@ -298,11 +668,15 @@ def create_uniform_chord_index_stream(stash, win_length, lexicon,
     lexicon : lexicon.Lexicon
         Instantiated chord lexicon for mapping labels to indices.
     working_size : int
-        Number of open streams at a time.
+        Unused; kept for backwards compatibility.
     pitch_shift : int
         Maximum number of semitones (+/-) to rotate an observation.
     partition_labels : dict
-
+    stash_file : str, default=None
+        Path of `stash`; if given, partition labels are read from its
+        chord-index sidecar (see `load_chord_index`).
+    chunk_size : int
+        Number of draws sharing entity loads.
 
     Returns
     -------
@@ -310,26 +684,16 @@ def create_uniform_chord_index_stream(stash, win_length, lexicon,
         Data stream of windowed chord entities.
     """
     if partition_labels is None:
-        partition_labels = util.partition(stash, index_mapper, lexicon)
+        partition_labels = partition_chord_labels(
+            stash, lexicon, index_mapper, stash_file)
 
     if valid_idx is None:
         valid_idx = range(lexicon.num_classes)
 
-    chord_pool = []
-    for chord_idx in valid_idx:
-        subindex = util.index_partition_arrays(partition_labels, [chord_idx])
-        entity_pool = [pescador.Streamer(chord_sampler, key, stash,
-                                         win_length, subindex,
-                                         sample_func=sample_func)
-                       for key in subindex.keys()]
-        if len(entity_pool) == 0:
-            continue
-        stream = pescador.mux(
-            entity_pool, n_samples=None, k=working_size, lam=20)
-        chord_pool.append(pescador.Streamer(stream))
-
-    stream = pescador.mux(chord_pool, n_samples=None, k=lexicon.vocab_dim,
-                          lam=None, with_replacement=False)
+    keys, table = chord_index_table(partition_labels, valid_idx)
+    stream = uniform_chord_sampler(stash, win_length, keys, table,
+                                   chunk_size=chunk_size,
+                                   sample_func=sample_func)
     if max_pitch_shift > 0:
         stream = pitch_shift_func(stream, max_pitch_shift=max_pitch_shift)
 
@@ -2,6 +2,7 @@ import numpy as np
 import sys
 import pyjams
 from dl4mir.common import util
+from dl4mir.common import viterbi
 
 
 if hasattr(sys, 'ps1'):
@@ -40,7 +41,8 @@ def populate_annotation(intervals, labels, confidence, annot):
         obs.label.confidence = conf
 
 
-def decode_posterior(entity, penalty, vocab, **viterbi_args):
+def decode_posterior(entity, penalty, vocab, viterbi_fx=util.viterbi,
+                     **viterbi_args):
     """Decode a posterior Entity to a RangeAnnotation.
 
     Parameters
@@ -51,6 +53,9 @@ def decode_posterior(entity, penalty, vocab, **viterbi_args):
         Self-transition penalty to use for Viterbi decoding.
     vocab : lexicon.Vocabulary
         Vocabulary object; expects an `index_to_label` method.
+    viterbi_fx : function, default=util.viterbi
+        Viterbi implementation to use, e.g. `viterbi.viterbi_beam` for large
+        state spaces such as a `lexicon.StrictBigram`.
     **viterbi_args : dict
         Other arguments to pass to the Viterbi algorithm.
 
@@ -59,7 +64,61 @@ def decode_posterior(entity, penalty, vocab, **viterbi_args):
     annot : pyjams.RangeAnnotation
         Populated chord annotation.
     """
-    y_idx = util.viterbi(entity.posterior, penalty=penalty, **viterbi_args)
+    y_idx = viterbi_fx(entity.posterior, penalty=penalty, **viterbi_args)
+    return path_to_annotation(entity, y_idx, penalty, vocab)
+
+
+def decode_posterior_streaming(entity, penalty, vocab, max_lag=100,
+                               **viterbi_args):
+    """Decode a posterior Entity to a RangeAnnotation, one frame at a time,
+    as would be done on a live stream.
+
+    Parameters
+    ----------
+    entity : biggie.Entity
+        Entity to decode; expects {posterior, time_points}.
+    penalty : scalar
+        Self-transition penalty to use for Viterbi decoding.
+    vocab : lexicon.Vocabulary
+        Vocabulary object; expects an `index_to_label` method.
+    max_lag : int, default=100
+        Maximum number of frames a decision may be deferred; if None, the
+        result is identical to offline decoding.
+    **viterbi_args : dict
+        Other arguments to pass to `viterbi.StreamingViterbi`.
+
+    Returns
+    -------
+    annot : pyjams.RangeAnnotation
+        Populated chord annotation.
+    """
+    decoder = viterbi.StreamingViterbi(
+        entity.posterior.shape[1], penalty=penalty, max_lag=max_lag,
+        **viterbi_args)
+    y_idx = [decoder.push(frame) for frame in entity.posterior]
+    y_idx = np.concatenate(y_idx + [decoder.flush()])
+    return path_to_annotation(entity, y_idx, penalty, vocab)
+
+
+def path_to_annotation(entity, y_idx, penalty, vocab):
+    """Convert a decoded state path to a RangeAnnotation.
+
+    Parameters
+    ----------
+    entity : biggie.Entity
+        Decoded entity; expects {posterior, time_points}.
+    y_idx : np.ndarray, shape=(num_obs,)
+        State indices through the posterior.
+    penalty : scalar
+        Self-transition penalty used to decode the path.
+    vocab : lexicon.Vocabulary
+        Vocabulary object; expects an `index_to_label` method.
+
+    Returns
+    -------
+    annot : pyjams.RangeAnnotation
+        Populated chord annotation.
+    """
     labels = vocab.index_to_label(y_idx)
 
     n_range = np.arange(len(y_idx))
@@ -78,6 +137,41 @@ def decode_posterior(entity, penalty, vocab, **viterbi_args):
     return annot
 
 
+def decode_posterior_penalties(entity, penalties, vocab,
+                               viterbi_fx=util.viterbi, **viterbi_args):
+    """Decode a posterior Entity under several penalties.
+
+    Parameters
+    ----------
+    entity : biggie.Entity
+        Entity to decode; expects {posterior, time_points}.
+    penalties : array_like
+        Self-transition penalties to use for Viterbi decoding.
+    vocab : lexicon.Vocabulary
+        Vocabulary object; expects an `index_to_label` method.
+    viterbi_fx : function, default=util.viterbi
+        Viterbi implementation with which to decode each penalty in turn. If
+        None, all penalties are decoded in a single pass of the log-domain
+        `viterbi.viterbi_penalties`; note that this may break ties (e.g. for
+        quantized posteriors) differently than `util.viterbi`.
+    **viterbi_args : dict
+        Other arguments to pass to the Viterbi algorithm.
+
+    Returns
+    -------
+    annots : list of pyjams.RangeAnnotation
+        Populated chord annotations, in the order of `penalties`.
+    """
+    if viterbi_fx is None:
+        paths = viterbi.viterbi_penalties(
+            entity.posterior, penalties, **viterbi_args)
+    else:
+        paths = [viterbi_fx(entity.posterior, penalty=penalty, **viterbi_args)
+                 for penalty in penalties]
+    return [path_to_annotation(entity, y_idx, penalty, vocab)
+            for y_idx, penalty in zip(paths, penalties)]
+
+
 def decode_posterior_parallel(entity, penalties, vocab, num_cpus=NUM_CPUS,
                               **viterbi_args):
     """Apply Viterbi decoding in parallel.
@@ -112,3 +206,76 @@ def decode_stash_parallel(stash, penalty, vocab, num_cpus=NUM_CPUS,
     decode = delayed(decode_posterior)
     results = pool(decode(stash.get(k), penalty, vocab) for k in keys)
     return {k: r for k, r in zip(keys, results)}
+
+
+def decode_stash_penalties_parallel(stash, penalties, vocab, num_cpus=NUM_CPUS,
+                                    viterbi_fx=util.viterbi, **viterbi_args):
+    """Decode every entity in a stash under several penalties.
+
+    Each entity is sent to a worker once, and decoded under every penalty
+    there; see `decode_posterior_penalties`.
+
+    Parameters
+    ----------
+    stash : dict_like
+        Collection of entities to decode; expects {posterior, time_points}.
+    penalties : array_like
+        Self-transition penalties to use for Viterbi decoding.
+    vocab : lexicon.Vocabulary
+        Vocabulary object; expects an `index_to_label` method.
+    viterbi_fx : function, default=util.viterbi
+        Viterbi implementation, or None for a single stacked pass.
+
+    Returns
+    -------
+    results : dict of dicts
+        Annotations, indexed by penalty and then by key.
+    """
+    assert not __interactive__
+    keys = stash.keys()
+    pool = Parallel(n_jobs=num_cpus)
+    decode = delayed(decode_posterior_penalties)
+    annots = pool(decode(stash.get(k), penalties, vocab, viterbi_fx,
+                         **viterbi_args)
+                  for k in keys)
+    return {p: {k: a[n] for k, a in zip(keys, annots)}
+            for n, p in enumerate(penalties)}
+
+
+def decode_stash_batch(stash, penalty, vocab, batch_size=32, **viterbi_args):
+    """Decode every entity in a stash, advancing batches of entities through
+    Viterbi in lockstep.
+
+    Entities are grouped by length to limit the padding in each batch; only
+    the time points of every entity are read up front, and posteriors are
+    loaded one batch at a time.
+
+    Parameters
+    ----------
+    stash : dict_like
+        Collection of entities to decode; expects {posterior, time_points}.
+    penalty : scalar
+        Self-transition penalty to use for Viterbi decoding.
+    vocab : lexicon.Vocabulary
+        Vocabulary object; expects an `index_to_label` method.
+    batch_size : int, default=32
+        Number of entities to decode at a time.
+    **viterbi_args : dict
+        Other arguments to pass to `viterbi.viterbi_batch`.
+
+    Returns
+    -------
+    results : dict
+        Annotations, indexed by key.
+    """
+    lengths = {k: len(stash.get(k).time_points) for k in stash.keys()}
+    keys = sorted(lengths, key=lengths.get)
+    results = dict()
+    for idx in range(0, len(keys), batch_size):
+        batch_keys = keys[idx:idx + batch_size]
+        entities = [stash.get(k) for k in batch_keys]
+        paths = viterbi.viterbi_batch(
+            [e.posterior for e in entities], penalty=penalty, **viterbi_args)
+        for k, entity, y_idx in zip(batch_keys, entities, paths):
+            results[k] = path_to_annotation(entity, y_idx, penalty, vocab)
+    return results
@@ -19,7 +19,7 @@ import pyjams
 
 from dl4mir.chords import PENALTY_VALUES
 from dl4mir.chords.lexicon import Strict
-from dl4mir.chords.decode import decode_stash_parallel
+from dl4mir.chords.decode import decode_stash_penalties_parallel
 
 from dl4mir.common import util
 from dl4mir.common import fileutil as futils
@@ -28,7 +28,7 @@ NUM_CPUS = 8
 
 
 def posterior_stash_to_jams(stash, penalty_values, output_directory,
-                            vocab, model_params):
+                            vocab, model_params, viterbi_fx=util.viterbi):
     """Decode a stash of posteriors to JAMS and write to disk.
 
     Parameters
@@ -44,12 +44,16 @@ def posterior_stash_to_jams(stash, penalty_values, output_directory,
         Map from posterior indices to string labels.
     model_params : dict
         Metadata to associate with the annotation.
+    viterbi_fx : function, default=util.viterbi
+        Viterbi implementation, or None to decode all penalties in a single
+        stacked pass; see `decode_posterior_penalties`.
     """
-    # Sweep over the default penalty values.
+    # Sweep over the default penalty values, sending each entity out once.
+    print "[{0}] \tStarting p = {1}".format(time.asctime(), penalty_values)
+    all_results = decode_stash_penalties_parallel(
+        stash, penalty_values, vocab, NUM_CPUS, viterbi_fx=viterbi_fx)
     for penalty in penalty_values:
-        print "[{0}] \tStarting p = {1}".format(time.asctime(), penalty)
-        results = decode_stash_parallel(stash, penalty, vocab, NUM_CPUS)
-
+        results = all_results[penalty]
         output_file = os.path.join(
             output_directory, "{0}.jamset".format(penalty))
 
@@ -89,7 +93,8 @@ def main(args):
 
         output_dir = os.path.join(args.output_directory, checkpoint)
         posterior_stash_to_jams(
-            stash, penalty_values, output_dir, vocab, model_params)
+            stash, penalty_values, output_dir, vocab, model_params,
+            viterbi_fx=None if args.stacked else util.viterbi)
 
 
 if __name__ == "__main__":
@@ -106,4 +111,7 @@ if __name__ == "__main__":
     parser.add_argument("--config", default='',
                         metavar="--config", type=str,
                         help="Optional JSON file with parameters for Viterbi.")
+    parser.add_argument("--stacked", action="store_true",
+                        help="Decode all penalties in one log-domain pass; "
+                             "faster, but ties may resolve differently.")
     main(parser.parse_args())
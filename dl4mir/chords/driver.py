@@ -8,7 +8,6 @@ import json
 
 import dl4mir.common.fileutil as futil
 import dl4mir.chords.data as D
-import dl4mir.common.streams as S
 from dl4mir.chords import DRIVER_ARGS
 from dl4mir.chords import models
 import dl4mir.chords.lexicon as lex
@@ -32,17 +31,18 @@ def main(args):
         trainer.load_param_values(args.init_param_file)
 
     print "Opening %s" % args.training_file
-    stash = biggie.Stash(args.training_file, cache=True)
-    stream = D.create_chord_index_stream(
-        stash, time_dim, max_pitch_shift=0, lexicon=VOCAB)
+    # All padded CQTs are stacked into one array by the batch sampler, so
+    # caching the entities as well would hold the corpus twice.
+    stash = biggie.Stash(args.training_file, cache=False)
+    stream = D.create_chord_index_batches(
+        stash, time_dim, lexicon=VOCAB, batch_size=BATCH_SIZE,
+        stash_file=args.training_file)
 
     # Load prior
     stat_file = "%s.json" % path.splitext(args.training_file)[0]
     prior = np.array(json.load(open(stat_file))['prior'], dtype=float)
     trainer.nodes['prior'].weight.value = 1.0 / prior.reshape(1, -1)
 
-    stream = S.minibatch(stream, batch_size=BATCH_SIZE)
-
     print "Starting '%s'" % args.trial_name
     driver = optimus.Driver(
         graph=trainer,
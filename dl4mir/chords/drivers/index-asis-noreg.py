@@ -27,7 +27,8 @@ def main(args):
     print "Opening %s" % args.training_file
     stash = biggie.Stash(args.training_file)
     stream = D.create_chord_index_stream(
-        stash, time_dim, max_pitch_shift=0, lexicon=VOCAB)
+        stash, time_dim, max_pitch_shift=0, lexicon=VOCAB,
+        stash_file=args.training_file)
 
     # Load prior
     stat_file = "%s.json" % path.splitext(args.training_file)[0]
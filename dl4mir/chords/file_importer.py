@@ -9,12 +9,12 @@ import biggie
 from os import path
 import time
 
+import dl4mir.common.featurestore as fstore
 import dl4mir.common.fileutil as futils
 
 # fold / split
 FILE_FMT = "%s/%s.hdf5"
 JAMS_EXT = "jams"
-NPZ_EXT = "npz"
 
 
 def create_chord_entity(npz_file, jams_file, dtype=np.float32):
@@ -23,7 +23,8 @@ def create_chord_entity(npz_file, jams_file, dtype=np.float32):
     Parameters
     ----------
     npz_file: str
-        Path to a 'npz' archive, containing at least a value for 'cqt'.
+        Path to a feature file ('npz' archive or memory-mappable 'npyd'
+        directory), containing at least a value for 'cqt'.
     jams_file: str
         Path to a corresponding JAMS file.
     dtype: type
@@ -34,14 +35,33 @@ def create_chord_entity(npz_file, jams_file, dtype=np.float32):
     entity: biggie.Entity
         Populated chord entity, with {cqt, chord_labels, *time_points}.
     """
-    entity = biggie.Entity(**np.load(npz_file))
+    entity = biggie.Entity(**fstore.load(npz_file))
+    entity.chord_labels = interpolate_chord_labels(
+        jams_file, entity.time_points)
+    entity.cqt = np.asarray(entity.cqt, dtype=dtype)
+    return entity
+
+
+def interpolate_chord_labels(jams_file, time_points):
+    """Sample the chord annotation of a JAMS file at the given times.
+
+    Parameters
+    ----------
+    jams_file: str
+        Path to a JAMS file.
+    time_points: np.ndarray
+        Times, in seconds, at which to sample the labels.
+
+    Returns
+    -------
+    chord_labels: list
+        Chord label at each time point; 'N' outside the annotation.
+    """
     jam = pyjams.load(jams_file)
     intervals = np.asarray(jam.chord[0].intervals)
     labels = [str(_) for _ in jam.chord[0].labels.value]
-    entity.chord_labels = mir_eval.util.interpolate_intervals(
-        intervals, labels, entity.time_points, fill_value='N')
-    entity.cqt = entity.cqt.astype(dtype)
-    return entity
+    return mir_eval.util.interpolate_intervals(
+        intervals, labels, time_points, fill_value='N')
 
 
 def populate_stash(keys, cqt_directory, jams_directory, stash,
@@ -53,7 +73,7 @@ def populate_stash(keys, cqt_directory, jams_directory, stash,
     keys: list
         Collection of fileset keys, of which a npz- and lab-file exist.
     cqt_directory: str
-        Base path for CQT npz-files.
+        Base path for CQT feature files (npyd or npz).
     jams_directory: str
         Base path for reference JAMS files.
     stash: biggie.Stash
@@ -63,7 +83,7 @@ def populate_stash(keys, cqt_directory, jams_directory, stash,
     """
     total_count = len(keys)
     for idx, key in enumerate(keys):
-        cqt_file = path.join(cqt_directory, "%s.%s" % (key, NPZ_EXT))
+        cqt_file = fstore.find(cqt_directory, key)
         jams_file = path.join(jams_directory, "%s.%s" % (key, JAMS_EXT))
         stash.add(key, create_chord_entity(cqt_file, jams_file, dtype))
         print "[%s] %12d / %12d: %s" % (time.asctime(), idx, total_count, key)
@@ -94,7 +114,7 @@ if __name__ == "__main__":
                         help="Path to splits of the data as JSON.")
     parser.add_argument("cqt_directory",
                         metavar="cqt_directory", type=str,
-                        help="Directory containing CQT npz files.")
+                        help="Directory containing CQT npz/npyd files.")
     parser.add_argument("jams_directory",
                         metavar="jams_directory", type=str,
                         help="Directory containing reference JAMS files.")
@@ -1,6 +1,7 @@
 import dl4mir.chords.labels as L
 import numpy as np
 import mir_eval
+import scipy.sparse
 
 
 class Lexicon(object):
@@ -170,6 +171,33 @@ class StrictBigram(Strict):
         chord_labels = [self._bigram_index_map.get(idx, "X") for idx in index]
         return chord_labels[0] if singleton else chord_labels
 
+    def transition_matrix(self):
+        """Build the sparse matrix of allowed transitions between bigram
+        states.
+
+        A state (a, b), i.e. chord b preceded by chord a, may persist or move
+        to any state (b, c); all other transitions are disallowed.
+
+        Returns
+        -------
+        transitions : scipy.sparse.csc_matrix, shape=(num_classes, num_classes)
+            Binary transition matrix, where element [j, i] is set if state i
+            may be followed by state j, as consumed by `viterbi.viterbi_beam`.
+        """
+        chords, successors = dict(), dict()
+        for b_idx, prev_map in self._bigram_tuple_map.items():
+            for a_idx, state_idx in prev_map.items():
+                chords[state_idx] = b_idx
+                successors.setdefault(a_idx, set()).add(state_idx)
+
+        rows, cols = [], []
+        for state_idx, b_idx in chords.items():
+            targets = successors.get(b_idx, set()).union([state_idx])
+            rows.extend(targets)
+            cols.extend([state_idx] * len(targets))
+        return scipy.sparse.csc_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=[self.num_classes]*2)
+
 
 __bigrams__ = [
     {'index': 0, 'label': (0, 0), 'weight': 21078.208933021091},
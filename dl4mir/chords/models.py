@@ -1,11 +1,21 @@
 import optimus
 import dl4mir.chords.labels as L
+from dl4mir.common.util import pad_tiles
 import numpy as np
 
 TIME_DIM = 20
 VOCAB = 157
 GRAPH_NAME = "classifier-V%03d" % VOCAB
 
+# Time pooling of the three layers of the iXc3 models, by input length.
+IXC3_TIME_POOLS = {
+    1: (1, 1, 1),
+    4: (1, 1, 1),
+    8: (1, 1, 1),
+    10: (2, 2, 1),
+    12: (2, 2, 1),
+    20: (2, 2, 2)}
+
 
 def classifier_init(nodes):
     for n in nodes:
@@ -176,13 +186,7 @@ def iXc3_nll(n_in, size='large', use_dropout=False):
         10: (3, 3, 1),
         20: (5, 5, 1)}[n_in]
 
-    p0, p1, p2 = {
-        1: (1, 1, 1),
-        4: (1, 1, 1),
-        8: (1, 1, 1),
-        10: (2, 2, 1),
-        12: (2, 2, 1),
-        20: (2, 2, 2)}[n_in]
+    p0, p1, p2 = IXC3_TIME_POOLS[n_in]
 
     input_data = optimus.Input(
         name='data',
@@ -342,13 +346,7 @@ def iXc3_fc_nll(n_in, size='large', use_dropout=False):
         10: (3, 3, 1),
         20: (5, 5, 1)}[n_in]
 
-    p0, p1, p2 = {
-        1: (1, 1, 1),
-        4: (1, 1, 1),
-        8: (1, 1, 1),
-        10: (2, 2, 1),
-        12: (2, 2, 1),
-        20: (2, 2, 2)}[n_in]
+    p0, p1, p2 = IXC3_TIME_POOLS[n_in]
 
     input_data = optimus.Input(
         name='data',
@@ -482,13 +480,7 @@ def iXc3_nll2(n_in, size='large', use_dropout=False):
         10: (3, 3, 1),
         20: (5, 5, 1)}[n_in]
 
-    p0, p1, p2 = {
-        1: (1, 1, 1),
-        4: (1, 1, 1),
-        8: (1, 1, 1),
-        10: (2, 2, 1),
-        12: (2, 2, 1),
-        20: (2, 2, 2)}[n_in]
+    p0, p1, p2 = IXC3_TIME_POOLS[n_in]
 
     input_data = optimus.Input(
         name='data',
@@ -1285,6 +1277,170 @@ def i20c3_mse12(size='large'):
     return trainer, predictor
 
 
+def dense_predictor(predictor, conv_layers, pool_shapes):
+    """Build a whole-track version of a windowed chord predictor.
+
+    Windowed predictors (e.g. `iXc3_nll`, `i8c4b10_nll_dropout`) are applied
+    to every window of a track by `util.convolve`, recomputing the features
+    of each frame once per window covering it. Here, the same parameters are
+    evaluated once over the full track, by dilating each layer in time by
+    the product of the time pooling before it.
+
+    Parameters
+    ----------
+    predictor : optimus.Graph
+        Windowed predictor, with Conv3D nodes named `conv_layers`, followed by
+        `chord_classifier` (Conv3D), `null_classifier` (Affine) and an
+        optional `prior` (Multiply) node.
+    conv_layers : list of str
+        Names of the (relu) Conv3D layers, in order.
+    pool_shapes : list of tuples
+        (time, frequency) pooling shape of each layer.
+
+    Returns
+    -------
+    predict : function
+        Maps a CQT, shaped (num_channels, num_frames, num_bins), to a dict
+        with its `posterior`, shaped (num_windows, VOCAB), such that row `i`
+        is the posterior of the window centered on frame `i`, as given by
+        `util.convolve`.
+    """
+    time_dim = predictor.inputs.values()[0].shape[2]
+    nodes = predictor.nodes
+    # Conv3D nodes convolve, rather than correlate, in both dimensions.
+    layers = [(nodes[name].weights.value[:, :, ::-1, ::-1],
+               nodes[name].bias.value, pool_shape)
+              for name, pool_shape in zip(conv_layers, pool_shapes)]
+    chord_weights = nodes['chord_classifier'].weights.value[:, :, 0, 0]
+    chord_bias = nodes['chord_classifier'].bias.value
+    null_weights = nodes['null_classifier'].weights.value
+    null_bias = nodes['null_classifier'].bias.value
+    prior = nodes['prior'].weight.value if 'prior' in nodes else 1.0
+
+    def predict(cqt):
+        num_frames = cqt.shape[1]
+        x_in = pad_tiles(np.asarray(cqt), time_dim, axis=1)
+        x_in = x_in[:, :num_frames + 2 * (time_dim // 2)]
+        length, dilation = time_dim, 1
+        for weights, bias, pool_shape in layers:
+            x_in = _dilated_conv(x_in, weights, bias, dilation)
+            x_in = _dilated_pool(x_in, pool_shape, dilation)
+            length = (length - weights.shape[2] + 1) // pool_shape[0]
+            dilation *= pool_shape[0]
+
+        # Features of each window, shaped (num_windows, k, length, bins).
+        num_windows = x_in.shape[1] - (length - 1) * dilation
+        index = np.arange(num_windows)[:, np.newaxis] + \
+            dilation * np.arange(length)[np.newaxis, :]
+        features = x_in[:, index].transpose(1, 0, 2, 3)
+
+        dtype = features.dtype
+        chord_out = np.einsum(
+            'kc,nctf->nktf', chord_weights.astype(dtype), features)
+        chord_out += chord_bias[np.newaxis, :, np.newaxis, np.newaxis]
+        null_out = np.dot(features.reshape(num_windows, -1),
+                          null_weights.astype(dtype))
+        logits = np.concatenate(
+            [chord_out.reshape(num_windows, -1), null_out + null_bias],
+            axis=1).astype(dtype)
+        posterior = np.exp(logits - logits.max(axis=1)[:, np.newaxis])
+        posterior /= posterior.sum(axis=1)[:, np.newaxis]
+        return dict(posterior=posterior * prior)
+
+    return predict
+
+
+def _dilated_conv(x_in, weights, bias, dilation, block_size=256):
+    """Rectified, 'valid' cross-correlation of a (channels, time, bins) array
+    with (k, channels, n_time, n_bins) weights, dilated in time.
+
+    Output frames are computed `block_size` at a time, bounding the size of
+    the frequency patches copied for each product.
+    """
+    num_taps = weights.shape[2]
+    num_frames = x_in.shape[1] - (num_taps - 1) * dilation
+    num_bins = x_in.shape[2] - weights.shape[3] + 1
+    # Frequency patches, shaped (channels, time, num_bins, n_bins).
+    strides = x_in.strides
+    patches = np.lib.stride_tricks.as_strided(
+        x_in, shape=x_in.shape[:2] + (num_bins, weights.shape[3]),
+        strides=strides + strides[-1:])
+    z_out = np.empty([weights.shape[0], num_frames, num_bins],
+                     dtype=x_in.dtype)
+    weights = weights.astype(x_in.dtype)
+    bias = bias.astype(x_in.dtype)
+    for start in range(0, num_frames, block_size):
+        stop = min(start + block_size, num_frames)
+        z_block = z_out[:, start:stop]
+        z_block[...] = bias[:, np.newaxis, np.newaxis]
+        for tap in range(num_taps):
+            offset = tap * dilation
+            z_block += np.tensordot(
+                weights[:, :, tap, :],
+                patches[:, start + offset:stop + offset],
+                axes=([1, 2], [0, 3]))
+    return np.maximum(z_out, 0.0, out=z_out)
+
+
+def _dilated_pool(x_in, pool_shape, dilation):
+    """Max-pool a (channels, time, bins) array, with stride one and the given
+    dilation in time, and without overlap in frequency."""
+    pool_time, pool_freq = pool_shape
+    num_frames = x_in.shape[1] - (pool_time - 1) * dilation
+    z_out = x_in[:, :num_frames]
+    for idx in range(1, pool_time):
+        offset = idx * dilation
+        z_out = np.maximum(z_out, x_in[:, offset:offset + num_frames])
+    num_bins = x_in.shape[2] // pool_freq
+    z_out = z_out[:, :, :num_bins * pool_freq]
+    return z_out.reshape(z_out.shape[:2] + (num_bins, pool_freq)).max(axis=-1)
+
+
+def iXc3_dense_predictor(predictor, n_in=None):
+    """Build the whole-track predictor of an `iXc3_nll` model.
+
+    Parameters
+    ----------
+    predictor : optimus.Graph
+        Predictor returned by `iXc3_nll(n_in, ...)`.
+    n_in : int, default=None
+        Input length of the model; if None, read from the predictor's input.
+
+    Returns
+    -------
+    predict : function
+        See `dense_predictor`.
+    """
+    if n_in is None:
+        n_in = predictor.inputs.values()[0].shape[2]
+    pool_shapes = [(p, f) for p, f in zip(IXC3_TIME_POOLS[n_in], (3, 1, 1))]
+    return dense_predictor(
+        predictor, ['layer0', 'layer1', 'layer2'], pool_shapes)
+
+
+def i8c4b10_dense_predictor(predictor):
+    """Build the whole-track predictor of an `i8c4b10_nll_dropout` model.
+
+    Parameters
+    ----------
+    predictor : optimus.Graph
+        Predictor returned by `i8c4b10_nll_dropout(...)`.
+
+    Returns
+    -------
+    predict : function
+        See `dense_predictor`.
+    """
+    return dense_predictor(
+        predictor, ['layer0', 'layer1', 'layer2', 'layer3'],
+        [(1, 3), (1, 1), (1, 1), (1, 1)])
+
+
+DENSE_PREDICTORS = {
+    'iXc3': iXc3_dense_predictor,
+    'i8c4b10': i8c4b10_dense_predictor}
+
+
 MODELS = {
     'L': lambda: iXc3_nll(20, 'large'),
     'XL': lambda: iXc3_nll(20, 'xlarge'),
@@ -35,9 +35,15 @@ def main():
     print "[{0}] Testing decode_posterior, stash".format(time.asctime())
     {k: D.decode_posterior(stash.get(k), -10.0, vocab) for k in stash.keys()}
 
+    print "[{0}] Testing decode_stash_batch".format(time.asctime())
+    D.decode_stash_batch(stash, -10.0, vocab)
+
     print "[{0}] Testing decode_stash_parallel".format(time.asctime())
     D.decode_stash_parallel(stash, -10.0, vocab, NUM_CPUS)
 
+    print "[{0}] Testing decode_stash_penalties_parallel".format(time.asctime())
+    D.decode_stash_penalties_parallel(stash, penalties, vocab, NUM_CPUS)
+
     print "[{0}] Done!".format(time.asctime())
 
 if __name__ == "__main__":
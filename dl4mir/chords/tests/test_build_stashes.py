@@ -0,0 +1,58 @@
+"""
+"""
+
+import unittest
+import os
+
+import numpy as np
+import pyjams
+
+import dl4mir.chords.build_stashes as B
+import dl4mir.common.featurestore as fstore
+import dl4mir.common.fileutil as futil
+
+
+class BuildStashesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = futil.TempDir()
+        self.jams_file = os.path.join(self.tmp_dir.path, "track.jams")
+        jam = pyjams.JAMS()
+        annot = jam.chord.create_annotation()
+        pyjams.util.fill_range_annotation_data(
+            [0.0, 1.0], [1.0, 2.5], ['C:maj', 'A:min'], annot)
+        pyjams.save(jam, self.jams_file)
+
+    def tearDown(self):
+        self.tmp_dir.close()
+
+    def test_interpolate_chord_labels(self):
+        labels = B.interpolate_chord_labels(
+            self.jams_file, np.array([0.5, 1.5, 2.0, 3.0]))
+        self.assertEqual(list(labels), ['C:maj', 'A:min', 'A:min', 'N'])
+
+    def test_compute_chord_fields(self):
+        time_points = np.arange(40) / 10.0
+        spectra = np.random.uniform(size=(1, 40, 252))
+        B_cqt = B.cqt
+        try:
+            B.cqt = lambda audio_file, **kwargs: (time_points, spectra)
+            feature_file = os.path.join(self.tmp_dir.path,
+                                        "track.%s" % fstore.EXT)
+            fields = B.compute_chord_fields(
+                "track.wav", self.jams_file, {}, B.create_kernel(21, 11),
+                feature_file=feature_file)
+        finally:
+            B.cqt = B_cqt
+
+        self.assertEqual(fields['cqt'].shape, spectra.shape)
+        self.assertEqual(fields['cqt'].dtype, np.float32)
+        np.testing.assert_equal(fields['time_points'], time_points)
+        self.assertEqual(len(fields['chord_labels']), len(time_points))
+        self.assertEqual(fields['chord_labels'][5], 'C:maj')
+        self.assertEqual(fields['chord_labels'][-1], 'N')
+        np.testing.assert_equal(fstore.load(feature_file)['cqt'],
+                                fields['cqt'])
+
+if __name__ == "__main__":
+    unittest.main()
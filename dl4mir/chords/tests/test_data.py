@@ -1,7 +1,12 @@
 import unittest
+import biggie
+import os
 import numpy as np
 import numpy.testing as nptest
 import dl4mir.chords.data as D
+import dl4mir.chords.lexicon as lex
+import dl4mir.common.fileutil as futil
+import dl4mir.common.util as util
 
 class DataTests(unittest.TestCase):
 
@@ -34,6 +39,94 @@ class DataTests(unittest.TestCase):
             D.extract_tile(x_in, 9, 5),
             np.array([7, 8, 9, 0, 0])[:, np.newaxis])
 
+    def test_create_chord_index_batches(self):
+        stash, labels = dict(), dict()
+        for key, num_frames in zip('abc', [3, 40, 17]):
+            stash[key] = biggie.Entity(
+                cqt=np.random.uniform(size=(1, num_frames, 12)))
+            labels[key] = np.random.randint(-1, 4, size=num_frames)
+
+        keys, table = D.chord_index_table(labels, range(4))
+        stream = D.create_chord_index_batches(
+            stash, 5, None, 8, partition_labels=labels, valid_idx=range(4),
+            sampling='frame')
+        np.random.seed(123)
+        batch = next(stream)
+        np.random.seed(123)
+        rows = table[np.random.randint(len(table), size=8)]
+
+        self.assertEqual(batch['data'].shape, (8, 1, 5, 12))
+        for data, class_idx, (n, idx, label) in zip(
+                batch['data'], batch['class_idx'], rows):
+            key = keys[n]
+            self.assertEqual(class_idx, labels[key][idx])
+            self.assertEqual(class_idx, label)
+            nptest.assert_array_equal(
+                data, util.slice_tile(stash[key].cqt[0], idx, 5)[np.newaxis])
+
+        # Batches are not overwritten by the next one.
+        data, class_idx = batch['data'].copy(), batch['class_idx'].copy()
+        next(stream)
+        nptest.assert_array_equal(batch['data'], data)
+        nptest.assert_array_equal(batch['class_idx'], class_idx)
+
+    def test_uniform_entity_sampler(self):
+        labels = dict(a=np.array([0, 1, 1]),
+                      b=np.array([2, 2, 0, 1, 2, -1] * 10))
+        keys, table = D.chord_index_table(labels, range(3))
+        rows = table[D.uniform_entity_sampler(table)(30000)]
+        # Each key is drawn equally, regardless of its length ...
+        self.assertAlmostEqual(rows[:, 0].mean(), 0.5, delta=0.02)
+        # ... and its frames uniformly.
+        frames_a = np.bincount(rows[rows[:, 0] == 0, 1], minlength=3)
+        nptest.assert_allclose(
+            frames_a / float(frames_a.sum()), [1 / 3.0] * 3, atol=0.02)
+        self.assertTrue(np.all(labels['b'][rows[rows[:, 0] == 1, 1]] >= 0))
+
+    def test_uniform_class_sampler(self):
+        labels = dict(a=np.array([0, 0, 0, 0, 0, 0, 1, -1]),
+                      b=np.array([1, 2, 2]))
+        keys, table = D.chord_index_table(labels, range(3))
+        rows = table[D.uniform_class_sampler(table)(30000)]
+        counts = np.bincount(rows[:, 2], minlength=3) / 30000.0
+        nptest.assert_allclose(counts, [1 / 3.0] * 3, atol=0.02)
+        # Class 1 occurs once in each key; each should be drawn equally.
+        keys_1 = rows[rows[:, 2] == 1, 0]
+        self.assertAlmostEqual(keys_1.mean(), 0.5, delta=0.03)
+
+    def test_load_chord_index(self):
+        vocab = lex.Strict(157)
+        stash = dict(a=biggie.Entity(chord_labels=['C:maj', 'N', 'X']),
+                     b=biggie.Entity(chord_labels=['A:min', 'C:maj']))
+        tmpdir = futil.TempDir()
+        stash_file = os.path.join(tmpdir.path, 'stash.hdf5')
+        with open(stash_file, 'w') as fh:
+            fh.write('stash')
+
+        labels, counts = D.load_chord_index(stash_file, vocab, stash=stash)
+        self.assertTrue(os.path.exists(D.chord_index_file(stash_file)))
+        self.assertEqual(counts.sum(), 4)
+        self.assertEqual(counts[vocab.label_to_index('C:maj')], 2)
+        nptest.assert_array_equal(
+            labels['a'], [vocab.label_to_index('C:maj'), 156, -1])
+
+        # Served from the sidecar, without touching the stash.
+        labels2, counts2 = D.load_chord_index(stash_file, vocab, stash=None)
+        nptest.assert_array_equal(counts, counts2)
+        for key in stash:
+            nptest.assert_array_equal(labels[key], labels2[key])
+
+        # Rewriting the stash invalidates the sidecar.
+        stash['b'] = biggie.Entity(chord_labels=['N', 'N', 'A:min'])
+        with open(stash_file, 'w') as fh:
+            fh.write('rewritten stash')
+        stat = os.stat(stash_file)
+        os.utime(stash_file, (stat.st_atime, stat.st_mtime + 10))
+        labels3, counts3 = D.load_chord_index(stash_file, vocab, stash=stash)
+        nptest.assert_array_equal(labels3['b'], [156, 156, 9 + 12])
+        self.assertEqual(counts3[156], 3)
+        self.assertEqual(counts3[vocab.label_to_index('C:maj')], 1)
+
 
 if __name__ == "__main__":
     unittest.main()
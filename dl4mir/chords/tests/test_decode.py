@@ -0,0 +1,49 @@
+"""
+"""
+
+import unittest
+import biggie
+import numpy as np
+import numpy.testing as nptest
+
+import dl4mir.chords.decode as D
+
+
+class DecodeTests(unittest.TestCase):
+
+    def setUp(self):
+        # Compare state paths, rather than the annotations built from them.
+        self.path_to_annotation = D.path_to_annotation
+        D.path_to_annotation = lambda entity, y_idx, penalty, vocab: y_idx
+
+    def tearDown(self):
+        D.path_to_annotation = self.path_to_annotation
+
+    def test_decode_posterior_penalties(self):
+        # Quantized posteriors, with zeros and ties.
+        posterior = np.round(np.random.uniform(size=(200, 25)) ** 4, 1)
+        posterior /= posterior.sum(axis=1)[:, np.newaxis]
+        entity = biggie.Entity(posterior=posterior,
+                               time_points=np.arange(200) / 20.0)
+        penalties = [-5.0, -20.0, -40.0]
+        paths = D.decode_posterior_penalties(entity, penalties, None)
+        for path, penalty in zip(paths, penalties):
+            nptest.assert_array_equal(
+                path, D.decode_posterior(entity, penalty, None))
+
+    def test_decode_stash_batch(self):
+        stash = dict()
+        for key, num_frames in zip('abcde', [30, 7, 52, 18, 30]):
+            posterior = np.random.uniform(size=(num_frames, 12))
+            stash[key] = biggie.Entity(
+                posterior=posterior / posterior.sum(axis=1)[:, np.newaxis],
+                time_points=np.arange(num_frames) / 20.0)
+        results = D.decode_stash_batch(stash, -10.0, None, batch_size=2)
+        self.assertEqual(sorted(results.keys()), sorted(stash.keys()))
+        for key, entity in stash.items():
+            nptest.assert_array_equal(
+                results[key], D.decode_posterior(entity, -10.0, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+"""
+
+import unittest
+
+import numpy as np
+import biggie
+
+import dl4mir.chords.models as M
+import dl4mir.common.util as U
+
+
+class ModelsTests(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_iXc3_dense_predictor(self):
+        for n_in in [20, 10]:
+            trainer, predictor = M.iXc3_nll(n_in, 'small')
+            for name in ['chord_classifier', 'null_classifier']:
+                node = predictor.nodes[name]
+                node.bias.value = np.random.normal(
+                    size=node.bias.value.shape)
+            cqt = np.random.uniform(size=(1, 50, 252)).astype(np.float32)
+            expected = U.convolve(biggie.Entity(data=cqt), predictor, 'data')
+            predict = M.iXc3_dense_predictor(predictor, n_in)
+            np.testing.assert_allclose(
+                predict(cqt)['posterior'], expected.posterior,
+                rtol=1e-4, atol=1e-6)
+
+    def test_i8c4b10_dense_predictor(self):
+        trainer, predictor = M.i8c4b10_nll_dropout()
+        for name in ['chord_classifier', 'null_classifier']:
+            node = predictor.nodes[name]
+            node.bias.value = np.random.normal(size=node.bias.value.shape)
+        cqt = np.random.uniform(size=(1, 30, 252)).astype(np.float32)
+        expected = U.convolve(biggie.Entity(cqt=cqt), predictor, 'cqt')
+        predict = M.i8c4b10_dense_predictor(predictor)
+        posterior = predict(cqt)['posterior']
+        self.assertEqual(posterior.dtype, np.float32)
+        np.testing.assert_allclose(
+            posterior, expected.posterior, rtol=1e-4, atol=1e-6)
+
+if __name__ == "__main__":
+    unittest.main()
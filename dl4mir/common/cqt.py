@@ -1,7 +1,25 @@
 """"""
 
+import claudio
 from claudio.fileio import FramedAudioReader
+from collections import OrderedDict
+import itertools
 import numpy as np
+import os
+import scipy.signal
+import scipy.sparse
+import tempfile
+import warnings
+
+# Zero-phase, anti-aliasing lowpass for halving the samplerate.
+HALFBAND_TAPS = scipy.signal.firwin(63, 0.475, window=('kaiser', 8.0))
+
+# Most recently used kernels, keyed by their parameters.
+KERNEL_CACHE_SIZE = 8
+_KERNEL_CACHE = OrderedDict()
+
+# Largest relative reconstruction error of a sparse kernel before warning.
+SPARSE_ERROR_TOLERANCE = 0.01
 
 
 def constantq_kernel(q, freq_min, octaves, samplerate, bins_per_octave):
@@ -56,10 +74,492 @@ def constantq_kernel(q, freq_min, octaves, samplerate, bins_per_octave):
     return np.fft.rfft(a_matrix.real, axis=1)
 
 
+def kernel_file(kernel_dir, q, freq_min, octaves, samplerate,
+                bins_per_octave):
+    """Return the path of a cached kernel under a directory."""
+    fbase = "cqt_kernel-q{0!r}-fmin{1!r}-oct{2}-sr{3!r}-bpo{4}.npy".format(
+        float(q), float(freq_min), int(octaves), float(samplerate),
+        int(bins_per_octave))
+    return os.path.join(kernel_dir, fbase)
+
+
+def cached_kernel(q, freq_min, octaves, samplerate, bins_per_octave,
+                  kernel_dir=None):
+    """Memoized `constantq_kernel`, optionally persisted to disk.
+
+    Up to KERNEL_CACHE_SIZE kernels are kept in memory; if `kernel_dir` is
+    given, kernels are also loaded from (or saved to) .npy files there, so
+    separate processes can share them.
+
+    Parameters
+    ----------
+    q, freq_min, octaves, samplerate, bins_per_octave
+        See `constantq_kernel`.
+    kernel_dir : str, default=None
+        Directory of cached kernels.
+
+    Returns
+    -------
+    kernel : np.ndarray
+        Read-only, 2D complex-valued matrix of CQT coefficients.
+    """
+    key = (float(q), float(freq_min), int(octaves), float(samplerate),
+           int(bins_per_octave))
+    kernel = _KERNEL_CACHE.pop(key, None)
+    if kernel is None and kernel_dir is not None:
+        fpath = kernel_file(kernel_dir, *key)
+        if os.path.exists(fpath):
+            kernel = np.load(fpath)
+        else:
+            kernel = constantq_kernel(*key)
+            fd, tmp_file = tempfile.mkstemp(suffix='.npy', dir=kernel_dir)
+            with os.fdopen(fd, 'wb') as fh:
+                np.save(fh, kernel)
+            os.rename(tmp_file, fpath)
+    elif kernel is None:
+        kernel = constantq_kernel(*key)
+
+    kernel.flags.writeable = False
+    _KERNEL_CACHE[key] = kernel
+    while len(_KERNEL_CACHE) > KERNEL_CACHE_SIZE:
+        _KERNEL_CACHE.popitem(last=False)
+    return kernel
+
+
+def sparsify_kernel(kernel, threshold=0.0054):
+    """Zero the small coefficients of a constant-Q kernel, after Brown and
+    Puckette (1992), and return it as a sparse matrix.
+
+    Parameters
+    ----------
+    kernel : np.ndarray, shape=(num_bins, num_coeffs)
+        Complex constant-Q kernel, in the Fourier domain.
+    threshold : scalar, default=0.0054
+        Coefficients with a magnitude below this fraction of the largest are
+        discarded; the default keeps the error within SPARSE_ERROR_TOLERANCE.
+
+    Returns
+    -------
+    sparse_kernel : scipy.sparse.csr_matrix
+        The thresholded kernel.
+    error : scalar
+        Relative (Frobenius) reconstruction error of the thresholded kernel.
+    """
+    magnitude = np.abs(kernel)
+    dense = np.where(magnitude >= threshold * magnitude.max(), kernel, 0)
+    error = np.linalg.norm(kernel - dense) / np.linalg.norm(kernel)
+    return scipy.sparse.csr_matrix(dense), error
+
+
+def octave_kernel(q, freq_min, octaves, samplerate, bins_per_octave,
+                  sparse_threshold=None, kernel_dir=None):
+    """Generate the constant-Q kernel for the top octave of an analysis.
+
+    The same kernel serves every octave, applied at successively halved
+    samplerates.
+
+    Parameters
+    ----------
+    q, freq_min, octaves, samplerate, bins_per_octave
+        See `cqt`.
+    sparse_threshold : scalar, default=None
+        If given, return a sparse kernel; see `sparsify_kernel`. A warning is
+        raised if its reconstruction error exceeds SPARSE_ERROR_TOLERANCE.
+    kernel_dir : str, default=None
+        Directory of cached kernels; see `cached_kernel`.
+
+    Returns
+    -------
+    kernel : np.ndarray, or scipy.sparse.csr_matrix
+        Complex constant-Q kernel, in the Fourier domain.
+    """
+    freq_min_top_octave = freq_min * 2 ** (octaves - 1)
+    freq_max = freq_min * 2 ** (octaves)
+    if freq_max > (samplerate / 2.0):
+        raise ValueError("Samplerate must be greater than {0} for the given "
+                         "parameters.".format(freq_max * 2))
+
+    kernel = cached_kernel(
+        q=q, freq_min=freq_min_top_octave,
+        octaves=1,
+        samplerate=samplerate,
+        bins_per_octave=bins_per_octave,
+        kernel_dir=kernel_dir)
+    if sparse_threshold is not None:
+        kernel, error = sparsify_kernel(kernel, sparse_threshold)
+        if error > SPARSE_ERROR_TOLERANCE:
+            warnings.warn(
+                "Sparse kernel reconstruction error of {0:0.4} exceeds {1}; "
+                "sparse_threshold={2} may be too large.".format(
+                    error, SPARSE_ERROR_TOLERANCE, sparse_threshold))
+    return kernel
+
+
+def apply_kernel(frames, kernel, chunk_size=None):
+    """Apply a constant-Q kernel to a sequence of frames, in batches.
+
+    Each batch of frames is transformed by one `rfft` and one (broadcast)
+    matrix product, which gives identical results to transforming the frames
+    one at a time.
+
+    Parameters
+    ----------
+    frames : np.ndarray, or iterable of np.ndarrays
+        Frames shaped (framesize, num_channels).
+    kernel : np.ndarray, shape=(num_bins, framesize / 2 + 1)
+        Constant-Q kernel, in the Fourier domain; may be a scipy.sparse matrix.
+    chunk_size : int, default=None
+        Maximum number of frames to transform at once, to bound peak memory;
+        if None, all frames are transformed together.
+
+    Returns
+    -------
+    spectra : np.ndarray, shape=(num_frames, num_bins, num_channels)
+        Constant-Q magnitude of each frame.
+    """
+    if isinstance(frames, np.ndarray):
+        step = chunk_size or max(len(frames), 1)
+        batches = (frames[n:n + step] for n in range(0, len(frames), step))
+    else:
+        frames = iter(frames)
+        batches = (np.array(list(itertools.islice(frames, chunk_size)))
+                   for _ in itertools.count())
+
+    def product(fft_batch):
+        if not scipy.sparse.issparse(kernel):
+            return np.matmul(kernel, fft_batch)
+        num_frames, num_coeffs, num_channels = fft_batch.shape
+        fft_batch = fft_batch.transpose(1, 0, 2).reshape(num_coeffs, -1)
+        return kernel.dot(fft_batch).reshape(
+            -1, num_frames, num_channels).transpose(1, 0, 2)
+
+    spectra = []
+    for batch in batches:
+        if len(batch) == 0:
+            break
+        spectra.append(np.abs(product(np.fft.rfft(batch, axis=1))))
+    if not spectra:
+        num_channels = frames.shape[-1] if isinstance(frames, np.ndarray) \
+            else 0
+        return np.zeros([0, kernel.shape[0], num_channels])
+    return np.concatenate(spectra, axis=0)
+
+
+def decimate(signal, taps=HALFBAND_TAPS):
+    """Halve the samplerate of a signal, with a zero-phase lowpass filter.
+
+    Sample `m` of the output is aligned in time with sample `2m` of the input.
+
+    Parameters
+    ----------
+    signal : np.ndarray, shape=(num_samples, num_channels)
+        Signal to decimate.
+    taps : np.ndarray, ndim=1
+        Odd-length, symmetric FIR filter to apply before downsampling.
+
+    Returns
+    -------
+    output : np.ndarray, shape=((num_samples + 1) / 2, num_channels)
+        Lowpassed signal, at half the samplerate.
+    """
+    delay = len(taps) // 2
+    num_samples = (len(signal) + 1) // 2
+    padded = np.zeros([len(signal) + 2 * delay] + list(signal.shape[1:]))
+    padded[delay:delay + len(signal)] = signal
+    output = np.zeros([num_samples] + list(signal.shape[1:]))
+    for k, h_k in enumerate(taps):
+        output += h_k * padded[k:k + 2 * num_samples:2]
+    return output
+
+
+def octave_signals(signal, octaves, taps=HALFBAND_TAPS):
+    """Generate a signal at successively halved samplerates.
+
+    Parameters
+    ----------
+    signal : np.ndarray, shape=(num_samples, num_channels)
+        Signal at the top samplerate.
+    octaves : int
+        Number of signals to generate, the first being `signal`.
+    taps : np.ndarray, ndim=1
+        Lowpass filter applied before each downsampling; see `decimate`.
+
+    Yields
+    ------
+    signal : np.ndarray, shape=(num_samples / 2**n, num_channels)
+        The signal at the n-th octave down.
+    """
+    for n in range(octaves):
+        yield signal
+        if n + 1 < octaves:
+            signal = decimate(signal, taps)
+
+
+def frame_starts(time_points, samplerate, framesize, alignment='center',
+                 offset=0):
+    """Map time points to the first sample of their analysis frames.
+
+    Parameters
+    ----------
+    time_points : array_like
+        Frame times, in seconds.
+    samplerate : scalar
+        Samplerate of the signal being framed.
+    framesize : int
+        Number of samples per frame.
+    alignment : str, default='center'
+        Justification for a frame around an index, one of 'left', 'center', or
+        'right'.
+    offset : scalar, default=0
+        Number of samples to offset each frame around an index.
+
+    Returns
+    -------
+    starts : np.ndarray of ints
+        Index of the first sample of each frame.
+    """
+    shift = dict(left=0, center=framesize // 2, right=framesize)
+    if not alignment in shift:
+        raise ValueError("Unknown alignment: %s" % alignment)
+    index = np.round(np.asarray(time_points) * samplerate).astype(int)
+    return index - shift[alignment] + int(offset)
+
+
+def frame_signal(signal, starts, framesize):
+    """Slice frames out of a signal, zero-padding beyond its edges.
+
+    Parameters
+    ----------
+    signal : np.ndarray, shape=(num_samples, num_channels)
+        Signal to frame.
+    starts : array_like of ints
+        Index of the first sample of each frame; may fall outside the signal.
+    framesize : int
+        Number of samples per frame.
+
+    Returns
+    -------
+    frames : np.ndarray, shape=(num_frames, framesize, num_channels)
+        The framed signal.
+    """
+    num_samples, num_channels = signal.shape
+    padded = np.zeros([num_samples + 2 * framesize, num_channels],
+                      dtype=signal.dtype)
+    padded[framesize:framesize + num_samples] = signal
+    windows = np.lib.stride_tricks.as_strided(
+        padded, shape=(num_samples + framesize + 1, framesize, num_channels),
+        strides=(padded.strides[0],) + padded.strides)
+    starts = np.clip(np.asarray(starts) + framesize, 0, len(windows) - 1)
+    return windows[starts]
+
+
+def signal_cqt(signal, samplerate, q=1.0, freq_min=27.5, octaves=7,
+               bins_per_octave=36, framerate=20.0, overlap=None, stride=None,
+               time_points=None, alignment='center', offset=0,
+               chunk_size=None, sparse_threshold=None, kernel_dir=None):
+    """Compute the Constant-Q Transform of a signal in memory.
+
+    Each octave is analyzed with the same kernel, over a copy of the signal
+    decimated by an in-memory cascade of halfband filters.
+
+    Parameters
+    ----------
+    signal : np.ndarray, shape=(num_samples, num_channels)
+        Signal to process.
+    samplerate : scalar
+        Samplerate of the signal.
+    ...
+        See `cqt` for all other parameters.
+
+    Returns
+    -------
+    time_points: np.ndarray
+        Time points of the analysis frames.
+    cqt_spectra: np.ndarray, shape=(num_channels, num_frames, num_bins)
+        Constant-Q coefficients for the audio signal.
+    """
+    signal = np.asarray(signal, dtype=float)
+    if signal.ndim == 1:
+        signal = signal[:, np.newaxis]
+
+    kernel = octave_kernel(q, freq_min, octaves, samplerate, bins_per_octave,
+                           sparse_threshold, kernel_dir)
+    framesize = 2 * (kernel.shape[1] - 1)
+
+    if time_points is None:
+        if stride is None and overlap is not None:
+            stride = framesize * (1.0 - overlap)
+        if stride is not None:
+            framerate = samplerate / float(stride)
+        num_frames = int(np.ceil(len(signal) * framerate / samplerate))
+        time_points = np.arange(num_frames) / float(framerate)
+    time_points = np.asarray(time_points, dtype=float)
+
+    return time_points, cascade_spectra(
+        signal, kernel, samplerate, octaves, time_points, alignment, offset,
+        chunk_size)
+
+
+def cascade_spectra(signal, kernel, samplerate, octaves, time_points,
+                    alignment='center', offset=0, chunk_size=None,
+                    first_sample=0):
+    """Apply a constant-Q kernel over the octave cascade of a signal.
+
+    Parameters
+    ----------
+    signal : np.ndarray, shape=(num_samples, num_channels)
+        Signal, or a segment of one, at the top samplerate.
+    kernel : np.ndarray, or scipy.sparse matrix
+        Constant-Q kernel for the top octave; see `octave_kernel`.
+    samplerate : scalar
+        Samplerate of the signal.
+    octaves : int
+        Number of octaves to compute.
+    time_points : np.ndarray
+        Frame times, in seconds, relative to the start of the full signal.
+    alignment, offset, chunk_size
+        See `cqt`.
+    first_sample : int, default=0
+        Index of `signal[0]` in the full signal; must be a multiple of
+        2**(octaves - 1), so that every octave's samples stay aligned.
+
+    Returns
+    -------
+    cqt_spectra: np.ndarray, shape=(num_channels, num_frames, num_bins)
+        Constant-Q coefficients for the frames.
+    """
+    framesize = 2 * (kernel.shape[1] - 1)
+    X = []
+    for n, x_n in enumerate(octave_signals(signal, octaves)):
+        sr_n = samplerate / 2.0 ** n
+        starts = frame_starts(time_points, sr_n, framesize, alignment,
+                              offset=offset / 2.0 ** n)
+        starts -= first_sample // 2 ** n
+        X.append(apply_kernel(frame_signal(x_n, starts, framesize), kernel,
+                              chunk_size))
+
+    # Octaves are computed top-down; reverse to order bins low to high.
+    X.reverse()
+    cqt_spectra = np.concatenate(X, axis=1)
+    return cqt_spectra.transpose(2, 0, 1)
+
+
+def stream_cqt(blocks, samplerate, q=1.0, freq_min=27.5, octaves=7,
+               bins_per_octave=36, framerate=20.0, alignment='center',
+               offset=0, block_frames=1000, chunk_size=None,
+               sparse_threshold=None, kernel_dir=None):
+    """Compute the Constant-Q Transform of a signal, streamed in blocks.
+
+    Frames are produced in fixed-size blocks, each computed over a bounded
+    segment of the signal that carries enough context on either side for
+    every octave; memory is independent of the length of the signal, and the
+    output is identical to that of `signal_cqt`.
+
+    Parameters
+    ----------
+    blocks : iterable of np.ndarrays
+        Consecutive blocks of the signal, shaped (num_samples, num_channels),
+        of any length.
+    samplerate : scalar
+        Samplerate of the signal.
+    block_frames : int, default=1000
+        Number of frames to yield at a time.
+    ...
+        See `cqt` for all other parameters; frames are placed at `framerate`.
+
+    Yields
+    ------
+    time_points: np.ndarray, shape=(block_frames,)
+        Time points of the analysis frames; shorter for the last block.
+    cqt_spectra: np.ndarray, shape=(num_channels, block_frames, num_bins)
+        Constant-Q coefficients for the frames.
+    """
+    kernel = octave_kernel(q, freq_min, octaves, samplerate, bins_per_octave,
+                           sparse_threshold, kernel_dir)
+    framesize = 2 * (kernel.shape[1] - 1)
+    # Segments start on a sample shared by every octave, and extend by the
+    # widest frame plus the filter delays of the cascade.
+    step = 2 ** (octaves - 1)
+    radius = (framesize + len(HALFBAND_TAPS)) * step + abs(int(offset)) + 1
+
+    blocks = iter(blocks)
+    buffered, first_sample, num_samples = [], 0, 0
+    frame_idx, finished = 0, False
+    while True:
+        time_points = np.arange(frame_idx, frame_idx + block_frames)
+        time_points = time_points / float(framerate)
+        last_sample = int(np.ceil(time_points[-1] * samplerate)) + radius
+        while not finished and first_sample + num_samples < last_sample:
+            try:
+                block = np.asarray(next(blocks), dtype=float)
+            except StopIteration:
+                finished = True
+                break
+            if block.ndim == 1:
+                block = block[:, np.newaxis]
+            buffered.append(block)
+            num_samples += len(block)
+
+        if finished:
+            num_frames = int(np.ceil(
+                (first_sample + num_samples) * framerate / samplerate))
+            time_points = time_points[:max(num_frames - frame_idx, 0)]
+            if len(time_points) == 0:
+                return
+
+        signal = np.concatenate(buffered, axis=0)
+        yield time_points, cascade_spectra(
+            signal, kernel, samplerate, octaves, time_points, alignment,
+            offset, chunk_size, first_sample)
+        frame_idx += len(time_points)
+
+        # Drop the samples that no later frame depends on.
+        start = int(frame_idx * samplerate / framerate) - radius
+        start = max(start - start % step, first_sample)
+        buffered = [signal[start - first_sample:]]
+        num_samples -= start - first_sample
+        first_sample = start
+
+
+def read_blocks(filepath, samplerate=11025.0, channels=1, bytedepth=2,
+                block_size=2**16):
+    """Generate consecutive blocks of samples from an audio file.
+
+    Note that the final block is trimmed to the end of the file, rather than
+    zero-padded, so that `stream_cqt` produces the same frames as `cqt`.
+
+    Parameters
+    ----------
+    filepath: str
+        Audio file to read.
+    samplerate, channels, bytedepth
+        See `cqt`.
+    block_size : int
+        Number of samples per block.
+
+    Yields
+    ------
+    block : np.ndarray, shape=(block_size, channels)
+        Consecutive samples of the file; shorter for the last block.
+    """
+    reader = FramedAudioReader(
+        filepath, framesize=block_size, samplerate=samplerate,
+        channels=channels, bytedepth=bytedepth, stride=block_size,
+        alignment='left')
+    num_samples = reader.wavefile.num_samples
+    for block in reader:
+        block = block[:num_samples]
+        if len(block) == 0:
+            return
+        num_samples -= len(block)
+        yield block
+
+
 def cqt(filepath, q=1.0, freq_min=27.5, octaves=7, bins_per_octave=36,
         framerate=20.0, samplerate=11025.0, channels=1, bytedepth=2,
         overlap=None, stride=None, time_points=None, alignment='center',
-        offset=0):
+        offset=0, cascade=False, chunk_size=None, sparse_threshold=None,
+        kernel_dir=None, block_size=None):
     """Compute the Constant-Q Transform of an audio file.
 
     Parameters
@@ -101,6 +601,22 @@ def cqt(filepath, q=1.0, freq_min=27.5, octaves=7, bins_per_octave=36,
         'right'.
     offset: scalar, default=0
         Number of samples to offset each frame around an index.
+    cascade: bool, default=False
+        If True, decode the file once and derive each octave by in-memory
+        decimation (see `signal_cqt`), rather than decoding and resampling the
+        file once per octave.
+    chunk_size: int, default=None
+        Maximum number of frames to transform at once; see `apply_kernel`.
+    sparse_threshold: scalar, default=None
+        If given, apply a sparse kernel thresholded at this relative magnitude;
+        see `sparsify_kernel` for the error this introduces.
+    kernel_dir: str, default=None
+        Directory of cached kernels to share across processes; see
+        `cached_kernel`.
+    block_size: int, default=None
+        If given with `cascade`, read and transform the file in blocks of this
+        many samples (see `stream_cqt`), rather than decoding it whole; frames
+        must then be placed by `framerate`.
 
     Returns
     -------
@@ -109,17 +625,35 @@ def cqt(filepath, q=1.0, freq_min=27.5, octaves=7, bins_per_octave=36,
     cqt_spectra: np.ndarray, shape=(num_channels, num_frames, num_bins)
         Constant-Q coefficients for the audio signal.
     """
-    freq_min_top_octave = freq_min * 2 ** (octaves - 1)
-    freq_max = freq_min * 2 ** (octaves)
-    if freq_max > (samplerate / 2.0):
-        raise ValueError("Samplerate must be greater than {0} for the given "
-                         "parameters.".format(freq_max * 2))
+    if cascade and block_size:
+        if not (overlap is None and stride is None and time_points is None):
+            raise ValueError(
+                "Streaming (block_size) only supports frames placed by "
+                "framerate.")
+        blocks = read_blocks(filepath, samplerate=samplerate,
+                             channels=channels, bytedepth=bytedepth,
+                             block_size=block_size)
+        results = list(stream_cqt(
+            blocks, samplerate, q=q, freq_min=freq_min, octaves=octaves,
+            bins_per_octave=bins_per_octave, framerate=framerate,
+            alignment=alignment, offset=offset, chunk_size=chunk_size,
+            sparse_threshold=sparse_threshold, kernel_dir=kernel_dir))
+        return (np.concatenate([t for t, _ in results]),
+                np.concatenate([x for _, x in results], axis=1))
 
-    kernel = constantq_kernel(
-        q=q, freq_min=freq_min_top_octave,
-        octaves=1,
-        samplerate=samplerate,
-        bins_per_octave=bins_per_octave)
+    if cascade:
+        signal, samplerate = claudio.read(
+            filepath, samplerate=samplerate, channels=channels,
+            bytedepth=bytedepth)
+        return signal_cqt(
+            signal, samplerate, q=q, freq_min=freq_min, octaves=octaves,
+            bins_per_octave=bins_per_octave, framerate=framerate,
+            overlap=overlap, stride=stride, time_points=time_points,
+            alignment=alignment, offset=offset, chunk_size=chunk_size,
+            sparse_threshold=sparse_threshold, kernel_dir=kernel_dir)
+
+    kernel = octave_kernel(q, freq_min, octaves, samplerate, bins_per_octave,
+                           sparse_threshold, kernel_dir)
     framesize = 2 * (kernel.shape[1] - 1)
 
     base_reader = FramedAudioReader(
@@ -144,11 +678,8 @@ def cqt(filepath, q=1.0, freq_min=27.5, octaves=7, bins_per_octave=36,
             yield this_reader
             n += 1
 
-    def fx(X):
-        return np.array(
-            [np.abs(np.dot(kernel, np.fft.rfft(x, axis=0))) for x in X])
-
-    X = [fx(reader) for reader in generate_readers(octaves)]
+    X = [apply_kernel(reader, kernel, chunk_size)
+         for reader in generate_readers(octaves)]
     # Note that readers are generated backwards; so, reverse the result.
     X.reverse()
     # Truncate to the shortest duration octave. These *should* be the same
@@ -156,3 +687,220 @@ def cqt(filepath, q=1.0, freq_min=27.5, octaves=7, bins_per_octave=36,
     n_len = min([X_i.shape[0] for X_i in X])
     cqt_spectra = np.concatenate([X_i[:n_len, :] for X_i in X], axis=1)
     return reader.time_points, cqt_spectra.transpose(2, 0, 1)
+
+
+class RingBuffer(object):
+    """Fixed-capacity buffer of the most recent samples of a signal.
+
+    Samples are addressed by their absolute index in the signal; reads before
+    the start of the signal, or past the end of a finished one, are zeros.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of samples held.
+    num_channels : int
+        Number of channels per sample.
+    """
+    def __init__(self, capacity, num_channels):
+        self._data = np.zeros([capacity, num_channels])
+        self.end = 0
+        self.oldest = 0
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def write(self, samples):
+        """Append samples, which must not overwrite any at or after `oldest`."""
+        num_samples = len(samples)
+        if self.end + num_samples - self.oldest > self.capacity:
+            raise ValueError("Ring buffer overflow: %d samples past %d, with "
+                             "capacity %d." % (num_samples, self.oldest,
+                                               self.capacity))
+        index = np.arange(self.end, self.end + num_samples) % self.capacity
+        self._data[index] = samples
+        self.end += num_samples
+
+    def read(self, start, stop):
+        """Return samples [start, stop), zero outside of [0, end)."""
+        output = np.zeros([stop - start, self._data.shape[1]])
+        first, last = max(start, 0), min(stop, self.end)
+        if first < last:
+            if first < self.end - self.capacity:
+                raise ValueError("Samples from %d have been overwritten."
+                                 % first)
+            index = np.arange(first, last) % self.capacity
+            output[first - start:last - start] = self._data[index]
+        return output
+
+
+class OnlineCQT(object):
+    """Constant-Q Transform of a live signal, pushed in arbitrary blocks.
+
+    Each octave keeps a ring buffer of samples, fed by an incremental halfband
+    decimation of the octave above. Frames are emitted as soon as every
+    octave holds their samples, after a delay of about `latency` seconds,
+    and are identical to those of `signal_cqt` over the whole signal.
+
+    Parameters
+    ----------
+    samplerate : scalar
+        Samplerate of the input signal.
+    num_channels : int, default=1
+        Number of channels of the input signal.
+    ...
+        See `cqt` for all other parameters; frames are placed at `framerate`.
+    """
+    def __init__(self, samplerate, q=1.0, freq_min=27.5, octaves=7,
+                 bins_per_octave=36, framerate=20.0, num_channels=1,
+                 alignment='center', offset=0, sparse_threshold=None,
+                 kernel_dir=None):
+        self.samplerate = float(samplerate)
+        self.framerate = float(framerate)
+        self.octaves = octaves
+        self.alignment = alignment
+        self.offset = offset
+        self.kernel = octave_kernel(
+            q, freq_min, octaves, samplerate, bins_per_octave,
+            sparse_threshold, kernel_dir)
+        self.framesize = 2 * (self.kernel.shape[1] - 1)
+        self.num_channels = num_channels
+
+        # Input is consumed a hop at a time; each octave holds the samples
+        # of pending frames, plus the filter history of the octave below.
+        self._hop = int(np.ceil(self.samplerate / self.framerate))
+        delay = len(HALFBAND_TAPS) // 2
+        context = self.framesize + 2 * delay + abs(int(offset)) + 2
+        self._buffers = [
+            RingBuffer(context * (2 ** (octaves - n) + 1) +
+                       2 * self._hop // 2 ** n, num_channels)
+            for n in range(octaves)]
+        self.reset()
+
+    def reset(self):
+        """Clear all buffers, to start a new signal."""
+        for buf in self._buffers:
+            buf.end, buf.oldest = 0, 0
+        self._num_frames = 0
+        self._finished = False
+
+    def _starts(self, frame_idx):
+        """Return the first sample of a frame, in each octave."""
+        time_point = np.array([frame_idx / self.framerate])
+        return [frame_starts(time_point, self.samplerate / 2.0 ** n,
+                             self.framesize, self.alignment,
+                             self.offset / 2.0 ** n)[0]
+                for n in range(self.octaves)]
+
+    @property
+    def latency(self):
+        """Approximate delay, in seconds, between a frame and its emission."""
+        delay = len(HALFBAND_TAPS) // 2
+        last_sample = max([2 ** n * (start + self.framesize - 1) +
+                           delay * (2 ** n - 1)
+                           for n, start in enumerate(self._starts(0))])
+        return (last_sample + 1) / self.samplerate
+
+    def _decimate(self, level, stop=None):
+        """Extend an octave from the one above, up to sample `stop`."""
+        source, target = self._buffers[level - 1], self._buffers[level]
+        delay = len(HALFBAND_TAPS) // 2
+        if stop is None:
+            stop = (source.end - delay - 1) // 2 + 1
+        start = target.end
+        if stop <= start:
+            return
+        segment = source.read(2 * start - delay, 2 * stop - 2 + delay + 1)
+        output = np.zeros([stop - start, self.num_channels])
+        for k, h_k in enumerate(HALFBAND_TAPS):
+            output += h_k * segment[k:k + 2 * (stop - start):2]
+        target.write(output)
+
+    def _emit(self, num_frames=None):
+        """Compute every frame whose samples are available in all octaves."""
+        starts = []
+        while num_frames is None or self._num_frames + len(starts) < num_frames:
+            frame_idx = self._num_frames + len(starts)
+            frame_starts_n = self._starts(frame_idx)
+            if num_frames is None and (
+                    frame_idx >= (self._buffers[0].end * self.framerate /
+                                  self.samplerate) or
+                    any([start + self.framesize > buf.end for start, buf
+                         in zip(frame_starts_n, self._buffers)])):
+                break
+            starts.append(frame_starts_n)
+
+        time_points = np.arange(self._num_frames, self._num_frames +
+                                len(starts)) / self.framerate
+        X = []
+        for n, buf in enumerate(self._buffers):
+            frames = np.array([buf.read(s[n], s[n] + self.framesize)
+                               for s in starts])
+            frames = frames.reshape(len(starts), self.framesize,
+                                    self.num_channels)
+            X.append(apply_kernel(frames, self.kernel))
+        self._num_frames += len(starts)
+
+        # Release samples that no pending frame or decimation depends on.
+        next_starts = self._starts(self._num_frames)
+        delay = len(HALFBAND_TAPS) // 2
+        for n, buf in enumerate(self._buffers):
+            oldest = next_starts[n]
+            if n + 1 < self.octaves:
+                oldest = min(oldest, 2 * self._buffers[n + 1].end - delay)
+            buf.oldest = max(buf.oldest, oldest)
+
+        X.reverse()
+        cqt_spectra = np.concatenate(X, axis=1).transpose(2, 0, 1)
+        return time_points, cqt_spectra
+
+    def process(self, block):
+        """Push a block of samples, returning any frames it completes.
+
+        Parameters
+        ----------
+        block : np.ndarray, shape=(num_samples, num_channels)
+            Next samples of the signal.
+
+        Returns
+        -------
+        time_points: np.ndarray
+            Time points of the completed frames.
+        cqt_spectra: np.ndarray, shape=(num_channels, num_frames, num_bins)
+            Constant-Q coefficients for the completed frames.
+        """
+        if self._finished:
+            raise ValueError("Signal has been flushed; call reset() first.")
+        block = np.asarray(block, dtype=float)
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+
+        results = [self._emit()]
+        for idx in range(0, len(block), self._hop):
+            self._buffers[0].write(block[idx:idx + self._hop])
+            for level in range(1, self.octaves):
+                self._decimate(level)
+            results.append(self._emit())
+
+        time_points = np.concatenate([t for t, _ in results])
+        return time_points, np.concatenate([x for _, x in results], axis=1)
+
+    def flush(self):
+        """End the signal, returning its remaining frames.
+
+        Returns
+        -------
+        time_points, cqt_spectra
+            See `process`.
+        """
+        if self._finished:
+            raise ValueError("Signal has already been flushed.")
+        self._finished = True
+        num_samples = self._buffers[0].end
+        for level in range(1, self.octaves):
+            num_samples = (num_samples + 1) // 2
+            self._decimate(level, stop=num_samples)
+        num_frames = int(np.ceil(
+            self._buffers[0].end * self.framerate / self.samplerate))
+        return self._emit(num_frames=max(num_frames, self._num_frames))
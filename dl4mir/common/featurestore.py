@@ -0,0 +1,103 @@
+"""Uncompressed, memory-mappable storage for arrays of features.
+
+A feature file is a directory holding one raw .npy file per field, e.g.
+
+    track.npyd/
+        cqt.npy
+        time_points.npy
+
+Fields can be opened with `mmap_mode`, so that only the frames accessed are
+read from disk. For convenience, npz archives are read and written through
+the same interface.
+"""
+
+import numpy as np
+import os
+import shutil
+import tempfile
+
+import dl4mir.common.fileutil as futil
+
+EXT = "npyd"
+NPZ_EXT = "npz"
+
+
+def save(filepath, **arrays):
+    """Atomically write a collection of arrays to disk.
+
+    Parameters
+    ----------
+    filepath : str
+        Output path; written as an npz archive if it ends in '.npz', and as a
+        directory of .npy files otherwise.
+    **arrays : np.ndarrays
+        Named arrays to save.
+    """
+    if futil.fileext(filepath).strip(".") == NPZ_EXT:
+        with futil.atomic_output(filepath) as tmp_path:
+            np.savez(tmp_path, **arrays)
+        return
+
+    parent = os.path.dirname(os.path.abspath(filepath))
+    tmp_dir = tempfile.mkdtemp(suffix=".%s" % EXT, dir=parent)
+    try:
+        for key, value in arrays.items():
+            np.save(os.path.join(tmp_dir, "%s.npy" % key), value)
+        if os.path.exists(filepath):
+            shutil.rmtree(filepath)
+        os.rename(tmp_dir, filepath)
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+def load(filepath, mmap_mode='r'):
+    """Load a collection of arrays from disk.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to a feature directory, or an npz archive.
+    mmap_mode : str, default='r'
+        Memory-map mode for the arrays of a feature directory (see
+        `np.load`); ignored for npz archives, which are read in full.
+
+    Returns
+    -------
+    arrays : dict of np.ndarrays
+        Named arrays.
+    """
+    if not os.path.isdir(filepath):
+        return dict(**np.load(filepath))
+
+    arrays = dict()
+    for fname in os.listdir(filepath):
+        key, ext = os.path.splitext(fname)
+        if ext == ".npy":
+            arrays[key] = np.load(os.path.join(filepath, fname),
+                                  mmap_mode=mmap_mode)
+    return arrays
+
+
+def find(directory, key, exts=(EXT, NPZ_EXT)):
+    """Return the path of a feature file under a directory.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to search.
+    key : str
+        File base of the feature file.
+    exts : tuple of str
+        Extensions to try, in order of preference.
+
+    Returns
+    -------
+    filepath : str
+        The first existing path, or that of the last extension if none exist.
+    """
+    for ext in exts:
+        filepath = os.path.join(directory, "%s.%s" % (key, ext))
+        if os.path.exists(filepath):
+            break
+    return filepath
@@ -2,6 +2,9 @@
 """
 import atexit
 from collections import namedtuple
+from contextlib import contextmanager
+import hashlib
+import json
 import os
 import shutil
 import tempfile as tmp
@@ -139,6 +142,188 @@ def create_directory(directory):
     return directory
 
 
+def checksum(filepath, block_size=2**20):
+    """Compute a quick checksum of a file.
+
+    Only the size, modification time, and first and last `block_size` bytes
+    are hashed, so large files are fingerprinted without reading them fully.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the file to fingerprint.
+    block_size : int
+        Number of bytes to hash from either end of the file.
+
+    Returns
+    -------
+    digest : str
+        Hex digest of the file's fingerprint.
+    """
+    stat = os.stat(filepath)
+    md5 = hashlib.md5(("%d:%r" % (stat.st_size, stat.st_mtime)).encode())
+    with open(filepath, 'rb') as fh:
+        md5.update(fh.read(block_size))
+        if stat.st_size > block_size:
+            fh.seek(max(block_size, stat.st_size - block_size))
+            md5.update(fh.read(block_size))
+    return md5.hexdigest()
+
+
+def md5sum(filepath, block_size=2**20):
+    """Compute the MD5 digest of a file's full contents.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the file to hash; directories are hashed over the names and
+        contents of their files.
+    block_size : int
+        Number of bytes to read at a time.
+
+    Returns
+    -------
+    digest : str
+        Hex digest of the file.
+    """
+    md5 = hashlib.md5()
+    if os.path.isdir(filepath):
+        for fname in sorted(os.listdir(filepath)):
+            md5.update(fname.encode())
+            md5.update(md5sum(os.path.join(filepath, fname)).encode())
+        return md5.hexdigest()
+
+    with open(filepath, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def fingerprint(params):
+    """Return a digest of a JSON-serializable collection of parameters."""
+    return hashlib.md5(
+        json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+@contextmanager
+def atomic_output(filepath):
+    """Context for writing a file atomically.
+
+    Yields a temporary path next to `filepath`, with the same extension, which
+    is moved to `filepath` only if the block completes.
+
+    Parameters
+    ----------
+    filepath : str
+        Final path of the file.
+    """
+    fd, tmp_path = tmp.mkstemp(
+        suffix=fileext(filepath),
+        dir=os.path.dirname(os.path.abspath(filepath)))
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.rename(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def file_state(filepath, params_key, output_file, use_hash=False):
+    """Describe an input file, for deciding if its output is up to date.
+
+    Parameters
+    ----------
+    filepath : str
+        Input file.
+    params_key : str
+        Fingerprint of the parameters used to process the file.
+    output_file : str
+        Output file computed from the input.
+    use_hash : bool, default=False
+        If True, identify the contents by their MD5 digest, rather than by
+        the modification time.
+
+    Returns
+    -------
+    state : dict
+        Record of the size, mtime or hash, parameters and output.
+    """
+    stat = os.stat(filepath)
+    state = dict(size=stat.st_size, params=params_key, output=output_file)
+    if use_hash:
+        state.update(md5=md5sum(filepath))
+    else:
+        state.update(mtime=stat.st_mtime)
+    return state
+
+
+def load_manifest(filepath):
+    """Load a manifest of processed files, or an empty one if missing."""
+    if not os.path.exists(filepath):
+        return dict()
+    with open(filepath) as fp:
+        return json.load(fp)
+
+
+def save_manifest(manifest, filepath):
+    """Atomically write a manifest of processed files."""
+    with atomic_output(filepath) as tmp_path:
+        with open(tmp_path, 'w') as fp:
+            json.dump(manifest, fp, indent=2, sort_keys=True)
+
+
+def run_incremental(func, file_pairs, params, manifest_file, pool,
+                    use_hash=False, batch_size=64):
+    """Apply a function to the file pairs whose outputs are out of date.
+
+    The manifest maps input files to their state when last processed (see
+    `file_state`), and is saved after every batch, so that an interrupted
+    run resumes where it stopped.
+
+    Parameters
+    ----------
+    func : joblib.delayed function
+        Processes a Pair of (input, output) files; returns True on success.
+    file_pairs : iterable of Pairs
+        Input and output files.
+    params : dict
+        JSON-serializable parameters that determine the outputs.
+    manifest_file : str
+        Path to the manifest (JSON).
+    pool : joblib.Parallel
+        Pool for running `func`.
+    use_hash : bool, default=False
+        See `file_state`.
+    batch_size : int, default=64
+        Number of files between manifest updates.
+
+    Returns
+    -------
+    results : list
+        Return values of `func`, for the files processed.
+    """
+    manifest = load_manifest(manifest_file)
+    params_key = fingerprint(params)
+    pending = []
+    for pair in file_pairs:
+        state = file_state(pair.first, params_key, pair.second, use_hash)
+        if manifest.get(pair.first) != state or \
+                not os.path.exists(pair.second):
+            pending.append((pair, state))
+
+    results = []
+    for idx in range(0, len(pending), batch_size):
+        batch = pending[idx:idx + batch_size]
+        batch_results = pool(func(pair) for pair, _ in batch)
+        for (pair, state), status in zip(batch, batch_results):
+            if status:
+                manifest[pair.first] = state
+        save_manifest(manifest, manifest_file)
+        results += list(batch_results)
+    return results
+
+
 def load_textlist(filepath):
     """Load a new-line separated list from a text-file.
 
@@ -1,11 +1,133 @@
 import numpy as np
+from scipy import ndimage
 from scipy.signal.signaltools import convolve2d
 from scipy.signal.windows import gaussian
 
 from .util import hwr
 
+# Kernels at least this long are applied in the frequency domain.
+FFT_THRESHOLD = 64
 
-def lcn(X, kernel):
+# Hanning window widths of the three bands blended by `lcn_octaves`.
+OCTAVE_WINDOWS = (73, 37, 19)
+
+
+def separate_kernel(kernel, tol=1e-10):
+    """Factor a 2D kernel into the outer product of two 1D kernels.
+
+    Parameters
+    ----------
+    kernel : np.ndarray, ndim=2
+        Convolution kernel.
+    tol : scalar
+        Maximum relative error of the factorization.
+
+    Returns
+    -------
+    col, row : np.ndarrays, or None
+        Kernels along the first and second dimension, such that
+        `np.outer(col, row)` reproduces `kernel`; None if it is not separable.
+    """
+    kernel = np.asarray(kernel, dtype=float)
+    if kernel.shape[0] == 1:
+        return np.ones(1), kernel[0]
+    elif kernel.shape[1] == 1:
+        return kernel[:, 0], np.ones(1)
+    U, s, Vt = np.linalg.svd(kernel)
+    col, row = U[:, 0] * np.sqrt(s[0]), Vt[0] * np.sqrt(s[0])
+    error = np.abs(np.outer(col, row) - kernel).max()
+    if error > tol * np.abs(kernel).max():
+        return None
+    return col, row
+
+
+def convolve1d(X, h, axis=0, fft_threshold=FFT_THRESHOLD):
+    """Convolve an array with a 1D kernel along one axis, with output the
+    same size as the input and symmetric boundary conditions.
+
+    Equivalent to `convolve2d(X, h, mode='same', boundary='symm')` for a
+    kernel shaped along `axis`.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Input array.
+    h : np.ndarray, ndim=1
+        Convolution kernel.
+    axis : int
+        Axis along which to convolve.
+    fft_threshold : int
+        Kernels at least this long are applied via the FFT.
+
+    Returns
+    -------
+    Y : np.ndarray
+        Filtered array; float32 inputs stay float32, others become float64.
+    """
+    dtype = _float_dtype(X)
+    h = np.asarray(h, dtype=dtype).ravel()
+    num_taps, length = len(h), X.shape[axis]
+    if num_taps == 1:
+        return X * h[0]
+    elif num_taps < fft_threshold:
+        # Even-length kernels are centered left of the midpoint.
+        return ndimage.convolve1d(X, h, axis=axis, mode='reflect',
+                                  output=dtype,
+                                  origin=num_taps % 2 - 1)
+
+    center = (num_taps - 1) // 2
+    pad = [(0, 0)] * X.ndim
+    pad[axis] = (num_taps - 1 - center, center)
+    Xp = np.pad(X, pad, mode='symmetric')
+    n_fft = int(2 ** np.ceil(np.log2(Xp.shape[axis])))
+    shape = [1] * X.ndim
+    shape[axis] = -1
+    H = np.fft.rfft(h, n_fft).reshape(shape)
+    Y = np.fft.irfft(np.fft.rfft(Xp, n_fft, axis=axis) * H, n_fft, axis=axis)
+    index = [slice(None)] * X.ndim
+    index[axis] = slice(num_taps - 1, num_taps - 1 + length)
+    return Y[tuple(index)].astype(dtype)
+
+
+def _float_dtype(X):
+    """Floating point type in which to filter an array."""
+    return X.dtype if X.dtype == np.float32 else np.dtype(np.float64)
+
+
+def convolve_same(X, kernel, fft_threshold=FFT_THRESHOLD):
+    """Convolve an array with a 2D kernel over its last two axes, with
+    output the same size as the input and symmetric boundary conditions.
+
+    Separable kernels are applied as two 1D convolutions, which is equivalent
+    to, and much faster than, `convolve2d(X, kernel, 'same', 'symm')`.
+
+    Parameters
+    ----------
+    X : np.ndarray, ndim>=2
+        Input representation, or a stack of them, e.g. (channels, time,
+        frequency).
+    kernel : np.ndarray, or tuple of np.ndarrays
+        2D convolution kernel, or its (col, row) factors.
+    fft_threshold : int
+        1D kernels at least this long are applied via the FFT.
+
+    Returns
+    -------
+    Y : np.ndarray
+        Filtered array.
+    """
+    factors = kernel if isinstance(kernel, tuple) else separate_kernel(kernel)
+    if factors is None and X.ndim > 2:
+        return np.array([convolve_same(x, kernel) for x in X])
+    elif factors is None:
+        kernel = np.asarray(kernel, dtype=_float_dtype(X))
+        return convolve2d(X, kernel, mode='same', boundary='symm')
+    col, row = factors
+    Y = convolve1d(X, col, axis=-2, fft_threshold=fft_threshold)
+    return convolve1d(Y, row, axis=-1, fft_threshold=fft_threshold)
+
+
+def lcn(X, kernel, threshold=None):
     """Apply Local Contrast Normalization (LCN) to an array.
 
     Parameters
@@ -14,6 +136,8 @@ def lcn(X, kernel):
         Input representation.
     kernel : np.ndarray
         Convolution kernel (should be roughly low-pass).
+    threshold : scalar, default=None
+        Floor on the local standard deviation; if None, its mean over `X`.
 
     Returns
     -------
@@ -22,15 +146,43 @@ def lcn(X, kernel):
     """
     if X.ndim != 2:
         raise ValueError("Input must be a 2D matrix.")
-    Xh = convolve2d(X, kernel, mode='same', boundary='symm')
-    V = X - Xh
-    S = np.sqrt(convolve2d(np.power(V, 2.0),
-                kernel, mode='same', boundary='symm'))
-    S2 = np.zeros(S.shape) + S.mean()
-    S2[S > S.mean()] = S[S > S.mean()]
+    V, S = local_deviation(X, kernel)
+    return _normalize(V, S, S.mean() if threshold is None else threshold)
+
+
+def local_deviation(X, kernel, rectify=False):
+    """Compute the local deviation from the mean of an array, and its local
+    standard deviation.
+
+    Parameters
+    ----------
+    X : np.ndarray, ndim=2
+        Input representation.
+    kernel : np.ndarray
+        Convolution kernel (should be roughly low-pass).
+    rectify : bool, default=False
+        Half-wave rectify the deviation.
+
+    Returns
+    -------
+    V : np.ndarray
+        Deviation from the local mean.
+    S : np.ndarray
+        Local standard deviation of V.
+    """
+    V = X - convolve_same(X, kernel)
+    if rectify:
+        V = hwr(V)
+    S = np.sqrt(hwr(convolve_same(np.power(V, 2.0), kernel)))
+    return V, S
+
+
+def _normalize(V, S, threshold, rho=1.0):
+    """Divide by the local standard deviation, floored at a threshold."""
+    S2 = np.maximum(S, threshold)
     if S2.sum() == 0.0:
         S2 += 1.0
-    return V / S2
+    return V / S2**rho
 
 
 def lcn_v2(X, kernel, mean_scalar=1.0):
@@ -51,17 +203,16 @@ def lcn_v2(X, kernel, mean_scalar=1.0):
     """
     if X.ndim != 2:
         raise ValueError("Input must be a 2D matrix.")
-    Xh = convolve2d(X, kernel, mode='same', boundary='symm')
+    Xh = convolve_same(X, kernel)
     V = X - Xh
-    S = np.sqrt(convolve2d(np.power(V, 2.0),
-                kernel, mode='same', boundary='symm'))
+    S = np.sqrt(hwr(convolve_same(np.power(V, 2.0), kernel)))
     thresh = np.exp(np.log(S + np.power(2.0, -5)).mean(axis=-1))
     S = S*np.greater(S - thresh.reshape(-1, 1), 0)
     S += 1.0*np.equal(S, 0.0)
     return V / S
 
 
-def lcn_mauch(X, kernel=None, rho=0):
+def lcn_mauch(X, kernel=None, rho=0, threshold=None):
     """Apply a version of local contrast normalization (LCN), inspired by
     Mauch, Dixon (2009), "Approximate Note Transcription...".
 
@@ -73,6 +224,8 @@ def lcn_mauch(X, kernel=None, rho=0):
         Convolution kernel (should be roughly low-pass).
     rho : scalar
         Scalar applied to the final output for heuristic range control.
+    threshold : scalar, default=None
+        Floor on the local standard deviation; if None, its mean over `X`.
 
     Returns
     -------
@@ -86,15 +239,9 @@ def lcn_mauch(X, kernel=None, rho=0):
         kernel = dim0_weights[:, np.newaxis] * dim1_weights[np.newaxis, :]
 
     kernel /= kernel.sum()
-    Xh = convolve2d(X, kernel, mode='same', boundary='symm')
-    V = hwr(X - Xh)
-    S = np.sqrt(
-        convolve2d(np.power(V, 2.0), kernel, mode='same', boundary='symm'))
-    S2 = np.zeros(S.shape) + S.mean()
-    S2[S > S.mean()] = S[S > S.mean()]
-    if S2.sum() == 0.0:
-        S2 += 1.0
-    return V / S2**rho
+    V, S = local_deviation(X, kernel, rectify=True)
+    return _normalize(V, S, S.mean() if threshold is None else threshold,
+                      rho)
 
 
 def highpass(X, kernel):
@@ -102,8 +249,8 @@ def highpass(X, kernel):
 
     Parameters
     ----------
-    X : np.ndarray, ndim=2
-        Input representation.
+    X : np.ndarray, ndim>=2
+        Input representation, or a stack of them.
     kernel : np.ndarray
         Convolution kernel (should be roughly low-pass).
 
@@ -112,10 +259,10 @@ def highpass(X, kernel):
     Z : np.ndarray
         The processed output.
     """
-    if X.ndim != 2:
-        raise ValueError("Input must be a 2D matrix.")
-    Xh = convolve2d(X, kernel, mode='same', boundary='symm')
-    return X - Xh
+    if X.ndim < 2:
+        raise ValueError("Input must be at least a 2D matrix.")
+    Xh = convolve_same(X, kernel)
+    return np.subtract(X, Xh, out=Xh)
 
 
 def local_l2norm(X, kernel):
@@ -123,8 +270,8 @@ def local_l2norm(X, kernel):
 
     Parameters
     ----------
-    X : np.ndarray, ndim=2
-        Input representation.
+    X : np.ndarray, ndim>=2
+        Input representation, or a stack of them.
     kernel : np.ndarray
         Convolution kernel (should be roughly low-pass).
 
@@ -133,9 +280,8 @@ def local_l2norm(X, kernel):
     Z : np.ndarray
         The processed output.
     """
-    local_mag = np.sqrt(convolve2d(np.power(X, 2.0),
-                        kernel, mode='same', boundary='symm'))
-    local_mag = local_mag + 1.0*(local_mag == 0.0)
+    local_mag = np.sqrt(hwr(convolve_same(np.power(X, 2.0), kernel)))
+    local_mag += local_mag == 0.0
     return X / local_mag
 
 
@@ -150,27 +296,73 @@ def lcn_octaves(X, kernel):
 
     Parameters
     ----------
-    X : np.ndarray, ndim=2, shape[1]==252.
-        CQT representation, with 36 bins per octave and 252 filters.
+    X : np.ndarray, ndim>=2, shape[-1]==252.
+        CQT representation, with 36 bins per octave and 252 filters, or a
+        stack of them, e.g. (channels, time, frequency).
     kernel : np.ndarray
         Convolution kernel (should be roughly low-pass).
 
     Returns
     -------
     Z : np.ndarray
-        The processed output.
+        The processed output; float32 if X is float32, float64 otherwise.
     """
     if X.shape[-1] != 252:
         raise ValueError(
             "Apologies, but this method is currently designed for input "
             "representations with a last dimension of 252.")
     x_hp = highpass(X, kernel)
-    x_73 = local_l2norm(x_hp, np.hanning(73).reshape(1, -1))
-    x_37 = local_l2norm(x_hp, np.hanning(37).reshape(1, -1))
-    x_19 = local_l2norm(x_hp, np.hanning(19).reshape(1, -1))
-    x_multi = np.array([x_73, x_37, x_19]).transpose(1, 2, 0)
-    w = _create_triband_mask()**2.0
-    return (x_multi * w).sum(axis=-1)
+    weights = (_create_triband_mask()[0]**2.0).astype(x_hp.dtype)
+    bands = [slice(np.flatnonzero(w)[0], np.flatnonzero(w)[-1] + 1)
+             for w in weights.T]
+    energies = _local_energies(np.power(x_hp, 2.0), OCTAVE_WINDOWS, bands)
+    Z = np.zeros_like(x_hp)
+    for local_mag, w, band in zip(energies, weights.T, bands):
+        # Each energy array is a fresh buffer, and can be reused in place.
+        np.maximum(local_mag, 0.0, out=local_mag)
+        np.sqrt(local_mag, out=local_mag)
+        local_mag += local_mag == 0.0
+        np.divide(w[band], local_mag, out=local_mag)
+        local_mag *= x_hp[..., band]
+        Z[..., band] += local_mag
+    return Z
+
+
+def _local_energies(E, widths, bands):
+    """Sum an array over Hanning windows of several widths along its last
+    axis, sharing a single forward FFT.
+
+    Each output is equivalent to a column range of
+    `convolve_same(E, np.hanning(n).reshape(1, -1))`.
+
+    Parameters
+    ----------
+    E : np.ndarray, ndim>=2
+        Input array, e.g. squared magnitudes.
+    widths : iterable of int
+        Window lengths.
+    bands : iterable of slices
+        Column range to return for each window.
+
+    Returns
+    -------
+    energies : list of np.ndarrays
+        Windowed sums over each band.
+    """
+    pad = max(widths) // 2
+    Ep = np.pad(E, [(0, 0)] * (E.ndim - 1) + [(pad, pad)], mode='symmetric')
+    # Circular wrap-around only reaches the first (n - 1) outputs, all of
+    # which fall in the padding, so no zero-padding is needed.
+    n_fft = Ep.shape[-1]
+    E_fft = np.fft.rfft(Ep, n_fft, axis=-1)
+    energies = []
+    for n, band in zip(widths, bands):
+        H = np.fft.rfft(np.hanning(n).astype(E.dtype), n_fft)
+        Y = np.fft.irfft(E_fft * H, n_fft, axis=-1)
+        offset = pad + (n - 1) // 2
+        energies.append(
+            Y[..., offset + band.start:offset + band.stop].astype(E.dtype))
+    return energies
 
 
 def _create_triband_mask():
@@ -229,3 +421,158 @@ def create_kernel(dim0, dim1):
     dim1_weights = gaussian(dim1, dim1 * 0.25, True)
     kernel = dim0_weights[:, np.newaxis] * dim1_weights[np.newaxis, :]
     return kernel / kernel.sum()
+
+
+def stream_segments(blocks, context, axis=-2):
+    """Regroup a stream of frame blocks into overlapping segments, such that
+    each frame is kept once, with `context` frames on either side.
+
+    A filter reaching no further than `context` frames along `axis` gives
+    the same result on the kept frames of each segment as it would on the
+    full array, symmetric boundaries included.
+
+    Parameters
+    ----------
+    blocks : iterable of np.ndarrays
+        Consecutive blocks of frames along `axis`, e.g. (channels, time,
+        frequency) spectra from `dl4mir.common.cqt.stream_cqt`.
+    context : int
+        Number of frames of context needed on either side.
+    axis : int, default=-2
+        Time axis of the blocks.
+
+    Yields
+    ------
+    segment : np.ndarray
+        Frames from the stream.
+    keep : slice
+        Frames of `segment` to keep, along `axis`.
+    """
+    buff, buff_start, num_done = None, 0, 0
+    for block in blocks:
+        block = np.asarray(block)
+        buff = block if buff is None else np.concatenate([buff, block], axis)
+        stop = buff_start + buff.shape[axis] - context
+        if stop <= num_done:
+            continue
+        yield buff, slice(num_done - buff_start, stop - buff_start)
+        num_done = stop
+        drop = num_done - context - buff_start
+        if drop > 0:
+            buff = _take(buff, slice(drop, None), axis)
+            buff_start += drop
+
+    if buff is not None and buff_start + buff.shape[axis] > num_done:
+        yield buff, slice(num_done - buff_start, buff.shape[axis])
+
+
+def _take(X, index, axis):
+    """Slice an array along one axis."""
+    return X[(slice(None),) * (axis % X.ndim) + (index,)]
+
+
+def lcn_threshold(blocks, kernel, rectify=False, axis=-2):
+    """Compute the global threshold of `lcn` (or `lcn_mauch`) in one pass
+    over a stream of blocks.
+
+    Parameters
+    ----------
+    blocks : iterable of np.ndarrays
+        Consecutive blocks of frames along `axis`.
+    kernel : np.ndarray
+        Convolution kernel (should be roughly low-pass); normalize it first
+        for `lcn_mauch`.
+    rectify : bool, default=False
+        Compute the threshold of `lcn_mauch`, rather than `lcn`.
+    axis : int, default=-2
+        Time axis of the blocks.
+
+    Returns
+    -------
+    threshold : scalar
+        Mean local standard deviation over all frames.
+    """
+    total, count = 0.0, 0
+    context = 2 * (len(kernel) // 2)
+    for segment, keep in stream_segments(blocks, context, axis):
+        S = _take(local_deviation(segment, kernel, rectify)[1], keep, axis)
+        total += S.sum()
+        count += S.size
+    return total / count if count else 0.0
+
+
+def stream_lcn(blocks, kernel, func=lcn, threshold=None, axis=-2, **kwargs):
+    """Apply an LCN function to a stream of frame blocks, without holding
+    the full array.
+
+    Blocks are processed in overlapping segments along the time axis. Local
+    operations (`lcn_v2`, `lcn_octaves`, `highpass`, `local_l2norm`) give
+    the same output as on the full array. The global threshold of `lcn` and
+    `lcn_mauch` is taken from `threshold` if given, e.g. from a first pass
+    of `lcn_threshold`, and otherwise from a running mean over the frames
+    seen so far. Blocks may be stacks, e.g. (channels, time, frequency), in
+    which case this threshold is shared across the stack.
+
+    The output of `dl4mir.common.cqt.stream_cqt` can be passed directly:
+    (time_points, spectra) tuples are normalized into tuples of the same
+    form, with time points re-aligned to the output frames.
+
+    Parameters
+    ----------
+    blocks : iterable of np.ndarrays, or of (time_points, np.ndarray) tuples
+        Consecutive blocks of frames along `axis`.
+    kernel : np.ndarray
+        Convolution kernel (should be roughly low-pass).
+    func : function
+        LCN function, called as `func(X, kernel, **kwargs)`.
+    threshold : scalar, default=None
+        Global threshold for `lcn` or `lcn_mauch`.
+    axis : int, default=-2
+        Time axis of the blocks.
+    **kwargs : dict
+        Further keyword arguments for `func`.
+
+    Yields
+    ------
+    Z : np.ndarray, or (time_points, np.ndarray) tuple
+        The processed output, a block at a time.
+    """
+    time_points = []
+
+    def spectra():
+        for block in blocks:
+            if isinstance(block, tuple):
+                time_points.append(np.asarray(block[0]))
+                block = block[1]
+            yield block
+
+    for Z in _stream_lcn(spectra(), kernel, func, threshold, axis, kwargs):
+        if not time_points:
+            yield Z
+            continue
+        time_points[:] = [np.concatenate(time_points)]
+        num_frames = Z.shape[axis]
+        yield time_points[0][:num_frames], Z
+        time_points[0] = time_points[0][num_frames:]
+
+
+def _stream_lcn(blocks, kernel, func, threshold, axis, kwargs):
+    """Generator behind `stream_lcn`, over blocks of frames only."""
+    context = 2 * (len(kernel) // 2)
+    rho = 1.0
+    if func is lcn_mauch:
+        kernel = kernel / kernel.sum()
+        rho = kwargs.get('rho', 0)
+    elif func is not lcn:
+        for segment, keep in stream_segments(blocks, context, axis):
+            yield _take(func(segment, kernel, **kwargs), keep, axis)
+        return
+
+    total, count = 0.0, 0
+    for segment, keep in stream_segments(blocks, context, axis):
+        V, S = local_deviation(segment, kernel, rectify=func is lcn_mauch)
+        V, S = _take(V, keep, axis), _take(S, keep, axis)
+        if threshold is None:
+            total += S.sum()
+            count += S.size
+        yield _normalize(V, S, total / count if count else threshold, rho)
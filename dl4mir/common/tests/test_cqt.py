@@ -0,0 +1,162 @@
+import numpy as np
+import os
+import warnings
+
+import dl4mir.common.cqt as C
+import dl4mir.common.fileutil as F
+
+
+def test_apply_kernel():
+    kernel = C.constantq_kernel(1.0, 110.0, 1, 8000.0, 12)
+    framesize = 2 * (kernel.shape[1] - 1)
+    frames = np.random.normal(size=(37, framesize, 2))
+    expected = np.array(
+        [np.abs(np.dot(kernel, np.fft.rfft(x, axis=0))) for x in frames])
+    for chunk_size in [None, 1, 10]:
+        np.testing.assert_equal(
+            C.apply_kernel(frames, kernel, chunk_size), expected)
+        np.testing.assert_equal(
+            C.apply_kernel(list(frames), kernel, chunk_size), expected)
+
+    sparse_kernel, error = C.sparsify_kernel(kernel, 0.01)
+    assert 0 < error < 0.05
+    assert sparse_kernel.nnz < kernel.size
+    np.testing.assert_allclose(
+        C.apply_kernel(frames, sparse_kernel, 10),
+        C.apply_kernel(frames, sparse_kernel.toarray()))
+
+
+def test_octave_kernel_sparse():
+    for params in [(1.0, 27.5, 7, 11025.0, 36), (0.75, 27.5, 8, 16000.0, 24)]:
+        error = C.sparsify_kernel(C.octave_kernel(*params))[1]
+        assert 0 < error < C.SPARSE_ERROR_TOLERANCE
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            C.octave_kernel(*params, sparse_threshold=0.0054)
+            assert len(caught) == 0
+            C.octave_kernel(*params, sparse_threshold=0.05)
+            assert len(caught) == 1
+
+
+def test_cached_kernel():
+    params = (1.0, 110.0, 1, 8000.0, 12)
+    kernel = C.cached_kernel(*params)
+    np.testing.assert_equal(kernel, C.constantq_kernel(*params))
+    assert C.cached_kernel(*params) is kernel
+    assert not kernel.flags.writeable
+
+    kernel_dir = F.TempDir()
+    C._KERNEL_CACHE.clear()
+    C.cached_kernel(*params, kernel_dir=kernel_dir.path)
+    assert os.path.exists(C.kernel_file(kernel_dir.path, *params))
+    C._KERNEL_CACHE.clear()
+    np.testing.assert_equal(
+        C.cached_kernel(*params, kernel_dir=kernel_dir.path), kernel)
+
+    for n in range(C.KERNEL_CACHE_SIZE + 1):
+        C.cached_kernel(1.0, 110.0 + n, 1, 8000.0, 12)
+    assert len(C._KERNEL_CACHE) == C.KERNEL_CACHE_SIZE
+    assert (1.0, 110.0, 1, 8000.0, 12) not in C._KERNEL_CACHE
+
+
+def test_decimate():
+    signal = np.ones([101, 2])
+    output = C.decimate(signal)
+    assert output.shape == (51, 2)
+    np.testing.assert_allclose(output[20:30], 1.0, atol=1e-3)
+
+    nyquist = np.cos(np.pi * np.arange(1000))[:, np.newaxis]
+    assert np.abs(C.decimate(nyquist)[50:-50]).max() < 1e-3
+
+
+def test_frame_signal():
+    signal = np.arange(1, 11)[:, np.newaxis]
+    frames = C.frame_signal(signal, [-6, -2, 4, 8, 12], 4)
+    np.testing.assert_equal(
+        frames[..., 0],
+        [[0, 0, 0, 0], [0, 0, 1, 2], [5, 6, 7, 8], [9, 10, 0, 0],
+         [0, 0, 0, 0]])
+    np.testing.assert_equal(
+        C.frame_starts([0, 1.0], 10, 4, 'center', offset=1), [-1, 9])
+
+
+def test_signal_cqt():
+    samplerate = 11025.0
+    for bin_idx in [5, 100, 250]:
+        freq = 27.5 * 2 ** (bin_idx / 36.0)
+        signal = np.sin(2 * np.pi * freq / samplerate *
+                        np.arange(int(2 * samplerate)))
+        time_points, cqt_spectra = C.signal_cqt(signal, samplerate)
+        assert cqt_spectra.shape == (1, len(time_points), 252)
+        assert cqt_spectra[0, 10:30].mean(axis=0).argmax() == bin_idx
+
+
+def test_stream_cqt():
+    samplerate = 8000.0
+    signal = np.random.normal(size=(int(7.3 * samplerate), 1))
+    time_points, cqt_spectra = C.signal_cqt(signal, samplerate, octaves=6)
+    blocks = np.array_split(signal, 13)
+    results = list(C.stream_cqt(blocks, samplerate, octaves=6,
+                                block_frames=40))
+    assert all([len(t) == 40 for t, _ in results[:-1]])
+    np.testing.assert_equal(
+        np.concatenate([t for t, _ in results]), time_points)
+    np.testing.assert_equal(
+        np.concatenate([x for _, x in results], axis=1), cqt_spectra)
+
+
+class PaddedBlockReader(object):
+    """Stands in for a left-aligned FramedAudioReader, zero-padding the last
+    block."""
+    def __init__(self, signal, framesize, **kwargs):
+        self.signal = signal
+        self.framesize = framesize
+        self.wavefile = type('AudioFile', (object,),
+                             dict(num_samples=len(signal)))
+
+    def __iter__(self):
+        for start in range(0, len(self.signal), self.framesize):
+            block = np.zeros([self.framesize, self.signal.shape[1]])
+            stop = min(start + self.framesize, len(self.signal))
+            block[:stop - start] = self.signal[start:stop]
+            yield block
+
+
+def test_read_blocks_stream_cqt(monkeypatch):
+    samplerate = 8000.0
+    signal = np.random.normal(size=(int(6.1 * samplerate), 1))
+    monkeypatch.setattr(
+        C, 'FramedAudioReader',
+        lambda filepath, **kwargs: PaddedBlockReader(signal, **kwargs))
+    blocks = list(C.read_blocks('audio.wav', samplerate, block_size=2**14))
+    assert sum([len(b) for b in blocks]) == len(signal)
+
+    time_points, cqt_spectra = C.signal_cqt(signal, samplerate, octaves=6)
+    results = list(C.stream_cqt(
+        C.read_blocks('audio.wav', samplerate, block_size=2**14),
+        samplerate, octaves=6, block_frames=40))
+    np.testing.assert_equal(
+        np.concatenate([t for t, _ in results]), time_points)
+    np.testing.assert_equal(
+        np.concatenate([x for _, x in results], axis=1), cqt_spectra)
+
+    stream_time_points, stream_spectra = C.cqt(
+        'audio.wav', octaves=6, samplerate=samplerate, cascade=True,
+        block_size=2**14)
+    np.testing.assert_equal(stream_time_points, time_points)
+    np.testing.assert_equal(stream_spectra, cqt_spectra)
+
+
+def test_OnlineCQT():
+    samplerate = 8000.0
+    signal = np.random.normal(size=(int(5.1 * samplerate), 2))
+    time_points, cqt_spectra = C.signal_cqt(signal, samplerate, octaves=6)
+    processor = C.OnlineCQT(samplerate, octaves=6, num_channels=2)
+    results = [processor.process(block)
+               for block in np.array_split(signal, 47)]
+    assert sum([len(t) for t, _ in results]) > 0
+    results.append(processor.flush())
+    np.testing.assert_equal(
+        np.concatenate([t for t, _ in results]), time_points)
+    np.testing.assert_equal(
+        np.concatenate([x for _, x in results], axis=1), cqt_spectra)
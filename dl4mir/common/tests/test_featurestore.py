@@ -0,0 +1,30 @@
+import numpy as np
+import os
+
+import dl4mir.common.featurestore as S
+import dl4mir.common.fileutil as F
+
+
+def test_save_load():
+    tmp = F.TempDir()
+    cqt = np.random.uniform(size=(1, 50, 252)).astype(np.float32)
+    time_points = np.arange(50) / 20.0
+    for ext in [S.EXT, S.NPZ_EXT]:
+        fpath = os.path.join(tmp.path, "track.%s" % ext)
+        S.save(fpath, cqt=cqt, time_points=time_points)
+        assert S.find(tmp.path, "track", exts=(ext,)) == fpath
+        data = S.load(fpath)
+        assert sorted(data.keys()) == ["cqt", "time_points"]
+        np.testing.assert_equal(data['cqt'], cqt)
+        np.testing.assert_equal(data['time_points'], time_points)
+
+    data = S.load(os.path.join(tmp.path, "track.%s" % S.EXT))
+    assert isinstance(data['cqt'], np.memmap)
+    assert S.find(tmp.path, "track") == os.path.join(
+        tmp.path, "track.%s" % S.EXT)
+
+    # Overwriting replaces every field.
+    S.save(os.path.join(tmp.path, "track.%s" % S.EXT), cqt=cqt[:, :10])
+    data = S.load(os.path.join(tmp.path, "track.%s" % S.EXT))
+    assert list(data.keys()) == ["cqt"]
+    assert data['cqt'].shape == (1, 10, 252)
@@ -32,3 +32,48 @@ def test_TempDir():
     tmp.close()
     assert not os.path.exists(fpath)
     assert not os.path.exists(dpath)
+
+
+def test_atomic_output():
+    tmp = F.TempDir()
+    fpath = os.path.join(tmp.path, "my_file.txt")
+    with F.atomic_output(fpath) as tmp_path:
+        assert tmp_path.endswith(".txt")
+        with open(tmp_path, 'w') as fh:
+            fh.write("done")
+    assert open(fpath).read() == "done"
+
+    try:
+        with F.atomic_output(os.path.join(tmp.path, "failed.txt")):
+            raise ValueError("Failed to write.")
+    except ValueError:
+        pass
+    assert os.listdir(tmp.path) == ["my_file.txt"]
+
+
+def test_run_incremental():
+    tmp = F.TempDir()
+    pairs = []
+    for name in ["a", "b"]:
+        pairs.append(F.Pair(os.path.join(tmp.path, name + ".in"),
+                            os.path.join(tmp.path, name + ".out")))
+        with open(pairs[-1].first, 'w') as fh:
+            fh.write(name)
+
+    def process(pair):
+        with open(pair.second, 'w') as fh:
+            fh.write(open(pair.first).read())
+        return True
+
+    manifest = os.path.join(tmp.path, "manifest.json")
+    assert len(F.run_incremental(process, pairs, {'x': 1}, manifest, list)) == 2
+    assert len(F.run_incremental(process, pairs, {'x': 1}, manifest, list)) == 0
+    os.remove(pairs[0].second)
+    assert len(F.run_incremental(process, pairs, {'x': 1}, manifest, list)) == 1
+    assert len(F.run_incremental(process, pairs, {'x': 2}, manifest, list)) == 2
+    with open(pairs[1].first, 'a') as fh:
+        fh.write("more")
+    assert len(F.run_incremental(process, pairs, {'x': 2}, manifest, list,
+                                 use_hash=True)) == 2
+    assert len(F.run_incremental(process, pairs, {'x': 2}, manifest, list,
+                                 use_hash=True)) == 0
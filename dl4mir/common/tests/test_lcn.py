@@ -0,0 +1,108 @@
+import numpy as np
+from scipy.signal import convolve2d
+
+import dl4mir.common.cqt as C
+import dl4mir.common.lcn as L
+
+
+def test_separate_kernel():
+    kernel = L.create_kernel(21, 11)
+    col, row = L.separate_kernel(kernel)
+    np.testing.assert_allclose(np.outer(col, row), kernel, atol=1e-15)
+    np.testing.assert_equal(L.separate_kernel(np.ones([1, 5]))[1], 1.0)
+    assert L.separate_kernel(np.eye(3)) is None
+
+
+def test_convolve_same():
+    X = np.random.normal(size=(50, 84))
+    kernels = [L.create_kernel(21, 11), L.create_kernel(4, 6),
+               np.hanning(73).reshape(1, -1), np.hanning(8).reshape(-1, 1),
+               np.random.uniform(size=(5, 4))]
+    for kernel in kernels:
+        expected = convolve2d(X, kernel, mode='same', boundary='symm')
+        for fft_threshold in [2, L.FFT_THRESHOLD]:
+            np.testing.assert_allclose(
+                L.convolve_same(X, kernel, fft_threshold), expected,
+                atol=1e-12)
+
+
+def test_lcn():
+    X = np.random.uniform(size=(40, 252))
+    kernel = L.create_kernel(21, 11)
+    V = X - convolve2d(X, kernel, mode='same', boundary='symm')
+    S = np.sqrt(convolve2d(V ** 2, kernel, mode='same', boundary='symm'))
+    S = np.maximum(S, S.mean())
+    np.testing.assert_allclose(L.lcn(X, kernel), V / S, atol=1e-12)
+    assert L.lcn_octaves(X, kernel).shape == X.shape
+
+
+def test_lcn_octaves():
+    X = np.random.uniform(size=(40, 252))
+    kernel = L.create_kernel(21, 11)
+    x_hp = L.highpass(X, kernel)
+    x_multi = np.array([L.local_l2norm(x_hp, np.hanning(n).reshape(1, -1))
+                        for n in L.OCTAVE_WINDOWS]).transpose(1, 2, 0)
+    expected = (x_multi * L._create_triband_mask()**2.0).sum(axis=-1)
+    np.testing.assert_allclose(L.lcn_octaves(X, kernel), expected,
+                               atol=1e-12)
+
+
+def test_stream_lcn():
+    X = np.random.uniform(size=(200, 252))
+    kernel = L.create_kernel(21, 11)
+    for func in [L.lcn_octaves, L.lcn_v2]:
+        output = L.stream_lcn(np.array_split(X, 17), kernel, func)
+        np.testing.assert_equal(np.concatenate(list(output)),
+                                func(X, kernel))
+
+    threshold = L.lcn_threshold(np.array_split(X, 17), kernel)
+    output = L.stream_lcn(np.array_split(X, 17), kernel,
+                          threshold=threshold)
+    np.testing.assert_allclose(np.concatenate(list(output)),
+                               L.lcn(X, kernel), atol=1e-12)
+    output = list(L.stream_lcn(np.array_split(X, 17), kernel))
+    assert np.concatenate(output).shape == X.shape
+
+    X = np.random.uniform(size=(2, 200, 252)).astype(np.float32)
+    for func in [L.lcn_octaves, L.highpass, L.local_l2norm]:
+        output = list(L.stream_lcn(np.array_split(X, 17, axis=1), kernel,
+                                   func))
+        assert output[0].dtype == np.float32
+        np.testing.assert_equal(np.concatenate(output, axis=1),
+                                func(X, kernel))
+
+    V, S = L.local_deviation(X, kernel)
+    threshold = L.lcn_threshold(np.array_split(X, 17, axis=1), kernel)
+    np.testing.assert_allclose(threshold, S.mean(), rtol=1e-5)
+    output = L.stream_lcn(np.array_split(X, 17, axis=1), kernel,
+                          threshold=threshold)
+    np.testing.assert_allclose(np.concatenate(list(output), axis=1),
+                               V / np.maximum(S, threshold), atol=1e-5)
+
+
+def test_lcn_octaves_batch():
+    X = np.random.uniform(size=(2, 30, 252))
+    kernel = L.create_kernel(21, 11)
+    expected = np.array([L.lcn_octaves(x, kernel) for x in X])
+    np.testing.assert_allclose(L.lcn_octaves(X, kernel), expected,
+                               atol=1e-12)
+
+    Z = L.lcn_octaves(X.astype(np.float32), kernel)
+    assert Z.dtype == np.float32
+    np.testing.assert_allclose(Z, expected, rtol=1e-3, atol=1e-4)
+
+
+def test_stream_lcn_cqt():
+    samplerate = 11025.0
+    signal = np.random.normal(size=(int(4.2 * samplerate), 1))
+    time_points, cqt_spectra = C.signal_cqt(signal, samplerate)
+    kernel = L.create_kernel(21, 11)
+    blocks = C.stream_cqt(np.array_split(signal, 9), samplerate,
+                          block_frames=30)
+    results = list(L.stream_lcn(blocks, kernel, L.lcn_octaves))
+    assert len(results) > 1
+    np.testing.assert_equal(
+        np.concatenate([t for t, _ in results]), time_points)
+    np.testing.assert_allclose(
+        np.concatenate([z for _, z in results], axis=1),
+        L.lcn_octaves(cqt_spectra, kernel), atol=1e-12)
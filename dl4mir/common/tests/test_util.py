@@ -19,6 +19,19 @@ def test_viterbi():
     np.testing.assert_equal(vit_idx, idx)
 
 
+def test_viterbi_structured():
+    posterior = np.random.uniform(size=(50, 13))
+    # Quantize to exercise tie-breaking.
+    posterior = np.round(posterior * 4) / 4.0
+    for penalty in [0, -1, -10]:
+        dense_idx = U.viterbi(posterior, penalty=penalty, structured=False)
+        struct_idx = U.viterbi(posterior, penalty=penalty, structured=True)
+        np.testing.assert_equal(struct_idx, dense_idx)
+
+    assert U.penalty_structure(np.ones([3, 3])) == (1.0, 1.0)
+    assert U.penalty_structure(np.arange(9).reshape(3, 3)) is None
+
+
 def test_stratify():
     num_items = 100
     items = range(num_items)
@@ -62,3 +75,48 @@ def test_convolve():
 
     np.testing.assert_equal(z.x_out, np.arange(10))
     np.testing.assert_equal(z.y, y)
+
+
+def test_predict_entity():
+    x = np.arange(10).reshape(1, 10, 1)
+    y = np.array(['a', 'b'])
+    entity = biggie.Entity(x_in=x, y=y)
+    z = U.predict_entity(entity, lambda x: dict(x_out=x.ravel()), 'x_in')
+
+    np.testing.assert_equal(z.x_out, np.arange(10))
+    np.testing.assert_equal(z.y, y)
+    assert not hasattr(z, 'x_in')
+
+
+def test_padded_windows():
+    x = np.random.uniform(size=(2, 25, 3))
+    for length in [1, 4, 5, 20, 40]:
+        pad = np.zeros([2, length // 2, 3])
+        x_padded = np.concatenate([pad, x, pad], axis=1)
+        expected = [x_padded[:, idx:idx + length]
+                    for idx in range(x_padded.shape[1] - length + 1)]
+        np.testing.assert_equal(U.padded_windows(x, length, axis=1),
+                                expected)
+
+
+def test_slice_padded_tile():
+    x = np.random.uniform(size=(25, 3))
+    for length in [1, 4, 5, 20, 40]:
+        x_padded = U.pad_tiles(x, length)
+        assert x_padded.shape == (25 + length, 3)
+        for idx in range(len(x)):
+            np.testing.assert_equal(
+                U.slice_padded_tile(x_padded, idx, length),
+                U.slice_tile(x, idx, length))
+
+
+def test_cqt_tile():
+    entity = biggie.Entity(cqt=np.random.uniform(size=(2, 25, 3)),
+                           chord_labels=['N'] * 25)
+    padded = U.pad_cqt_entity(entity, 5)
+    np.testing.assert_equal(padded.cqt, entity.cqt)
+    out = np.zeros([2, 5, 3])
+    for idx in range(25):
+        expected = U.cqt_tile(entity, idx, 5)
+        np.testing.assert_equal(U.cqt_tile(padded, idx, 5), expected)
+        np.testing.assert_equal(U.cqt_tile(padded, idx, 5, out=out), expected)
@@ -0,0 +1,109 @@
+import numpy as np
+
+import dl4mir.common.util as U
+import dl4mir.common.viterbi as V
+
+
+def test_log_viterbi():
+    posterior = np.random.uniform(size=(100, 13))
+    trans_mat = np.random.uniform(size=(13, 13))
+    for penalty in [0, -1, -10]:
+        np.testing.assert_equal(
+            V.log_viterbi(posterior, penalty=penalty),
+            U.viterbi(posterior, penalty=penalty))
+        np.testing.assert_equal(
+            V.log_viterbi(posterior, trans_mat, penalty=penalty),
+            U.viterbi(posterior, trans_mat, penalty=penalty))
+
+
+def test_ViterbiDecoder():
+    decoder = V.ViterbiDecoder(13, penalty=-5, dtype=np.float32)
+    assert decoder.psi_dtype == np.int16
+    assert decoder.structure is not None
+    for num_obs in [50, 10, 200]:
+        posterior = np.random.uniform(size=(num_obs, 13))
+        np.testing.assert_equal(
+            decoder.decode(posterior), U.viterbi(posterior, penalty=-5))
+
+
+def test_viterbi_penalties():
+    posterior = np.random.uniform(size=(100, 13))
+    trans_mat = np.random.uniform(size=(13, 13))
+    penalties = [-1, -5, -10, -40]
+    for tmat in [None, trans_mat]:
+        paths = V.viterbi_penalties(posterior, penalties, tmat)
+        assert paths.shape == (len(penalties), len(posterior))
+        for path, penalty in zip(paths, penalties):
+            np.testing.assert_equal(
+                path, V.log_viterbi(posterior, tmat, penalty=penalty))
+
+
+def test_viterbi_batch():
+    posteriors = [np.random.uniform(size=(n, 13)) for n in [1, 40, 25, 100]]
+    for penalty in [0, -10]:
+        paths = V.viterbi_batch(posteriors, penalty=penalty)
+        for path, posterior in zip(paths, posteriors):
+            np.testing.assert_equal(
+                path, V.log_viterbi(posterior, penalty=penalty))
+
+
+def test_StreamingViterbi():
+    posterior = np.random.uniform(size=(200, 13))
+    decoder = V.StreamingViterbi(13, penalty=-10, max_lag=None)
+    path = [decoder.push(frame) for frame in posterior]
+    path = np.concatenate(path + [decoder.flush()])
+    np.testing.assert_equal(path, V.log_viterbi(posterior, penalty=-10))
+
+    decoder = V.StreamingViterbi(13, penalty=-10, max_lag=5)
+    path = []
+    for frame in posterior:
+        path.append(decoder.push(frame))
+        assert decoder.lag <= 5
+    path = np.concatenate(path + [decoder.flush()])
+    assert len(path) == len(posterior)
+
+
+def test_viterbi_beam():
+    posterior = np.random.uniform(size=(100, 13))
+    trans_mat = np.random.uniform(size=(13, 13))
+    trans_mat *= np.random.uniform(size=(13, 13)) > 0.5
+    trans_mat += np.eye(13)
+    np.testing.assert_equal(
+        V.viterbi_beam(posterior, trans_mat, penalty=-5),
+        V.log_viterbi(posterior, trans_mat, penalty=-5))
+
+    path, stats = V.viterbi_beam(posterior, trans_mat, penalty=-5,
+                                 beam_width=4, return_stats=True)
+    assert len(path) == len(posterior)
+    assert stats['max_active'] <= 4
+    assert 0.0 < stats['pruning_rate'] < 1.0
+
+
+def test_sparse_step():
+    num_states = 30
+    # Quantized weights, so that many incoming scores tie.
+    trans_mat = np.round(np.random.uniform(size=(num_states, num_states)), 1)
+    trans_mat *= np.random.uniform(size=(num_states, num_states)) > 0.7
+    trans_mat[:, 3] = 0
+    trans_mat[3, :] = 0
+    trans_mat[3, 3] = 1
+    indptr, indices, log_weights = V.sparse_log_transitions(trans_mat, -1)
+    delta = np.round(np.random.uniform(size=num_states), 1)
+    active = np.sort(np.random.permutation(num_states)[:12])
+    active = active[active != 3]
+
+    values, predecessors = V._sparse_step(
+        delta, active, indptr, indices, log_weights)
+    with np.errstate(divide='ignore'):
+        log_trans = np.log(trans_mat) - 1 * (1 - np.eye(num_states))
+    scores = delta[active][np.newaxis, :] + log_trans[:, active]
+    np.testing.assert_allclose(values, scores.max(axis=1))
+    reached = np.isfinite(values)
+    np.testing.assert_equal(
+        predecessors[reached], active[scores[reached].argmax(axis=1)])
+    np.testing.assert_equal(predecessors[~reached], 0)
+    assert not reached[3]
+
+    values, predecessors = V._sparse_step(
+        delta, active[:0], indptr, indices, log_weights)
+    assert np.all(np.isneginf(values)) and not predecessors.any()
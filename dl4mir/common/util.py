@@ -2,7 +2,6 @@ from __future__ import print_function
 import biggie
 from itertools import groupby
 import numpy as np
-import optimus
 import os
 import scipy.stats
 import shutil
@@ -204,8 +203,80 @@ def lp_scale(x, p=2.0, axis=None):
     return x / scalar
 
 
+def penalty_structure(transition_matrix):
+    """Identify a transition matrix that only distinguishes self-transitions.
+
+    Parameters
+    ----------
+    transition_matrix: np.ndarray, shape=(num_states, num_states)
+        Transition matrix to inspect.
+
+    Returns
+    -------
+    weights: tuple, or None
+        The (self_weight, other_weight) pair if every diagonal element and
+        every off-diagonal element share a single value, respectively;
+        otherwise None.
+    """
+    transition_matrix = np.asarray(transition_matrix)
+    num_states = transition_matrix.shape[0]
+    diagonal = np.eye(num_states, dtype=bool)
+    self_values = transition_matrix[diagonal]
+    other_values = transition_matrix[np.invert(diagonal)]
+    if not (self_values == self_values[0]).all():
+        return None
+    if other_values.size and not (other_values == other_values[0]).all():
+        return None
+    other_weight = other_values[0] if other_values.size else 0.0
+    return self_values[0], other_weight
+
+
+def _structured_step(delta, self_weight, other_weight):
+    """Max-product step for a transition matrix of the form
+    `self_weight * I + other_weight * (1 - I)`, in O(num_states).
+
+    The result is identical to taking the max / argmax over the rows of the
+    dense product, including the first-index tie-breaking of `np.argmax`.
+
+    Parameters
+    ----------
+    delta: np.ndarray, shape=(num_states,)
+        Path scores at the previous step.
+    self_weight: scalar
+        Weight of staying in the same state.
+    other_weight: scalar
+        Weight of moving to any other state.
+
+    Returns
+    -------
+    values: np.ndarray, shape=(num_states,)
+        Best incoming score for each state.
+    indices: np.ndarray, shape=(num_states,)
+        Index of the best predecessor for each state.
+    """
+    num_states = len(delta)
+    states = np.arange(num_states)
+    self_res = delta * self_weight
+    other_res = delta * other_weight
+
+    # Running max of the off-diagonal terms; the runner-up only matters for
+    #   the state that holds the max itself.
+    first = other_res.argmax()
+    masked = other_res.copy()
+    masked[first] = -np.inf
+    second = masked.argmax()
+    best_other = np.where(states == first, second, first)
+    other_max = np.where(states == first, masked[second], other_res[first])
+
+    values = np.maximum(self_res, other_max)
+    indices = np.where(other_max > self_res, best_other, states)
+    ties = other_max == self_res
+    indices[ties] = np.minimum(states, best_other)[ties]
+    return values, indices
+
+
 def viterbi(posterior, transition_matrix=None, prior=None, penalty=0,
-            scaled=True):
+            scaled=True, structured=None):
     """Find the optimal Viterbi path through a posteriorgram.
 
     Ported closely from Tae Min Cho's MATLAB implementation.
@@ -229,6 +300,12 @@ def viterbi(posterior, transition_matrix=None, prior=None, penalty=0,
         Scale transition probabilities between steps in the algorithm.
         Note: Hard-coded to True in TMC's implementation; it's probably a bad
         idea to change this.
+    structured : bool, default=None
+        If True, use the O(num_states) update for transition matrices that
+        only distinguish self-transitions from all others, e.g. the default
+        penalty-only case; if False, always use the dense O(num_states^2)
+        update. If None, the structure is detected from the transitions.
+        Both updates produce identical paths.
 
     Returns
     -------
@@ -258,6 +335,14 @@ def viterbi(posterior, transition_matrix=None, prior=None, penalty=0,
     penalty = offset * np.exp(penalty) + np.eye(num_states, dtype=np.float)
     transition_matrix = penalty * transition_matrix
 
+    weights = None
+    if structured or structured is None:
+        weights = penalty_structure(transition_matrix)
+        if weights is None and structured:
+            raise ValueError("`transition_matrix` only supports a structured "
+                             "update if its diagonal and off-diagonal "
+                             "values are each constant.")
+
     # Create a uniform prior if one isn't provided.
     prior = np.ones(num_states) / float(num_states) if prior is None else prior
 
@@ -270,9 +355,13 @@ def viterbi(posterior, transition_matrix=None, prior=None, penalty=0,
     delta[idx, :] = scaler(prior * posterior[idx, :])
 
     for idx in range(1, num_obs):
-        res = delta[idx - 1, :].reshape(1, num_states) * transition_matrix
-        delta[idx, :] = scaler(np.max(res, axis=1) * posterior[idx, :])
-        psi[idx, :] = np.argmax(res, axis=1)
+        if weights is None:
+            res = delta[idx - 1, :].reshape(1, num_states) * transition_matrix
+            values, indices = np.max(res, axis=1), np.argmax(res, axis=1)
+        else:
+            values, indices = _structured_step(delta[idx - 1, :], *weights)
+        delta[idx, :] = scaler(values * posterior[idx, :])
+        psi[idx, :] = indices
 
     path[-1] = np.argmax(delta[-1, :])
     for idx in range(num_obs - 2, -1, -1):
@@ -353,6 +442,64 @@ def slice_tile(x_in, idx, length):
     return tile
 
 
+def pad_tiles(x_in, length, axis=0):
+    """Zero-pad an array once, such that every centered tile of `length` is a
+    plain slice of the result.
+
+    For any valid index `idx`, the tile returned by `slice_tile(x_in, idx,
+    length)` is equal to `slice_padded_tile(pad_tiles(x_in, length), idx,
+    length)`, without copying the full array for each tile.
+
+    Parameters
+    ----------
+    x_in : np.ndarray
+        Array to pad.
+    length : int
+        Total length of the tiles to extract.
+    axis : int, default=0
+        Axis along which tiles are extracted.
+
+    Returns
+    -------
+    x_padded : np.ndarray
+        Padded array; `x_padded.shape[axis] == x_in.shape[axis] + length`.
+    """
+    pad_width = [(0, 0)] * x_in.ndim
+    pad_width[axis] = (length // 2, length - length // 2)
+    return np.pad(x_in, pad_width, mode='constant')
+
+
+def slice_padded_tile(x_padded, idx, length, axis=0, out=None):
+    """Extract a centered tile from an array padded by `pad_tiles`.
+
+    Parameters
+    ----------
+    x_padded : np.ndarray
+        Output of `pad_tiles`, for the same `length` and `axis`.
+    idx : int
+        Centered index for the resulting tile, relative to the unpadded array.
+    length : int
+        Total length for the output tile.
+    axis : int, default=0
+        Axis along which tiles are extracted.
+    out : np.ndarray, default=None
+        If given, the tile is written into this array rather than returned
+        as a view.
+
+    Returns
+    -------
+    z_out : np.ndarray
+        The extracted tile; a view of `x_padded` unless `out` is given.
+    """
+    index = [slice(None)] * x_padded.ndim
+    index[axis] = slice(idx, idx + length)
+    tile = x_padded[tuple(index)]
+    if out is None:
+        return tile
+    out[...] = tile
+    return out
+
+
 def stratify(items, num_folds, valid_ratio=0.1):
     """Stratify a collection of items `num_folds` times into partitions for
     train, validation, and test.
@@ -516,10 +663,73 @@ def slice_cqt_entity(entity, length, idx=None):
         The windowed chord observation.
     """
     idx = np.random.randint(entity.cqt.shape[1]) if idx is None else idx
-    cqt = np.array([slice_tile(x, idx, length) for x in entity.cqt])
+    cqt = cqt_tile(entity, idx, length)
     return biggie.Entity(cqt=cqt, chord_label=entity.chord_labels[idx])
 
 
+def pad_cqt_entity(entity, length):
+    """Pad the CQT of an Entity once, for windowed sampling via `cqt_tile`.
+
+    The returned Entity shares all other fields with `entity`, and gains a
+    `padded_cqt` field; its `cqt` field is a view into the padded array, so
+    no additional memory is used. Entities without a CQT are returned as-is.
+
+    Parameters
+    ----------
+    entity : Entity, with a cqt field
+        Observation to pad.
+        Note that entity.cqt is shaped (num_channels, num_frames, num_bins).
+    length : int
+        Length of the windows that will be sliced.
+
+    Returns
+    -------
+    padded_entity : biggie.Entity
+        Entity with an additional `padded_cqt` field.
+    """
+    if not hasattr(entity, 'cqt'):
+        return entity
+    values = entity.values()
+    padded_cqt = pad_tiles(np.asarray(values.pop('cqt')), length, axis=1)
+    start = length // 2
+    cqt = padded_cqt[:, start:padded_cqt.shape[1] - length + start]
+    return biggie.Entity(cqt=cqt, padded_cqt=padded_cqt, **values)
+
+
+def cqt_tile(entity, idx, length, out=None):
+    """Return a centered window of an Entity's CQT, in O(length).
+
+    Entities prepared by `pad_cqt_entity` for this `length` are sliced
+    without copying; otherwise, each channel is tiled via `slice_tile`.
+
+    Parameters
+    ----------
+    entity : Entity, with at least a cqt field
+        Observation to window.
+        Note that entity.cqt is shaped (num_channels, num_frames, num_bins).
+    idx : int
+        Centered frame index for the window.
+    length : int
+        Length of the window.
+    out : np.ndarray, shape=(num_channels, length, num_bins), default=None
+        Optional buffer to write the window into.
+
+    Returns
+    -------
+    cqt : np.ndarray, shape=(num_channels, length, num_bins)
+        The windowed CQT.
+    """
+    padded_cqt = getattr(entity, 'padded_cqt', None)
+    if padded_cqt is not None and \
+            padded_cqt.shape[1] == entity.cqt.shape[1] + length:
+        return slice_padded_tile(padded_cqt, idx, length, axis=1, out=out)
+    cqt = np.array([slice_tile(x, idx, length) for x in entity.cqt])
+    if out is None:
+        return cqt
+    out[...] = cqt
+    return out
+
+
 def compress_samples_to_intervals(labels, time_points):
     """Compress a set of time-aligned labels via run-length encoding.
 
@@ -549,6 +759,37 @@ def compress_samples_to_intervals(labels, time_points):
     return np.array(intervals), new_labels
 
 
+def padded_windows(x_in, length, axis=0):
+    """Return every centered window of an array as a strided view over a
+    single zero-padded copy, as stepped by `optimus.array_stepper` in 'same'
+    mode.
+
+    Parameters
+    ----------
+    x_in : np.ndarray
+        Array to window.
+    length : int
+        Length of each window.
+    axis : int, default=0
+        Axis along which to step.
+
+    Returns
+    -------
+    windows : np.ndarray, shape=(num_windows,) + window_shape
+        Read-only view of the windows, where the window shape equals that of
+        `x_in` with `length` along `axis`.
+    """
+    x_padded = pad_tiles(x_in, length, axis=axis)
+    num_windows = x_in.shape[axis] + 2 * (length // 2) - length + 1
+    shape = list(x_padded.shape)
+    shape[axis] = length
+    windows = np.lib.stride_tricks.as_strided(
+        x_padded, shape=[num_windows] + shape,
+        strides=(x_padded.strides[axis],) + x_padded.strides)
+    windows.flags.writeable = False
+    return windows
+
+
 def convolve(entity, graph, input_key, axis=1, chunk_size=250):
     """Apply a graph convolutionally to a field in an an entity.
 
@@ -572,31 +813,50 @@ def convolve(entity, graph, input_key, axis=1, chunk_size=250):
     # TODO(ejhumphrey): Make this more stable, somewhat fragile as-is
     time_dim = graph.inputs.values()[0].shape[2]
     values = entity.values()
-    input_stepper = optimus.array_stepper(
-        values.pop(input_key), time_dim, axis=axis, mode='same')
-    results = dict([(k, list()) for k in graph.outputs])
-    if chunk_size:
-        chunk = []
-        for x in input_stepper:
-            chunk.append(x)
-            if len(chunk) == chunk_size:
-                for k, v in graph(np.array(chunk)).items():
-                    results[k].append(v)
-                chunk = []
-        if len(chunk):
-            for k, v in graph(np.array(chunk)).items():
-                results[k].append(v)
-    else:
-        for x in input_stepper:
-            for k, v in graph(x[np.newaxis, ...]).items():
-                results[k].append(v)
-    for k in results:
-        results[k] = np.concatenate(results[k], axis=0)
+    windows = padded_windows(
+        np.asarray(values.pop(input_key)), time_dim, axis=axis)
+    chunk_size = chunk_size or 1
+    # Windows are copied into one contiguous buffer, and the outputs written
+    # directly into arrays allocated on the first step.
+    chunk = np.empty((chunk_size,) + windows.shape[1:], dtype=windows.dtype)
+    results = dict()
+    for start in range(0, len(windows), chunk_size):
+        stop = min(start + chunk_size, len(windows))
+        chunk[:stop - start] = windows[start:stop]
+        for k, v in graph(chunk[:stop - start]).items():
+            if k not in results:
+                results[k] = np.empty((len(windows),) + v.shape[1:],
+                                      dtype=v.dtype)
+            results[k][start:stop] = v
     values.update(results)
     return biggie.Entity(**values)
 
 
-def process_stash(stash, transform, output, input_key, verbose=False):
+def predict_entity(entity, predict, input_key):
+    """Apply a whole-track predictor to a field in an entity.
+
+    Parameters
+    ----------
+    entity : biggie.Entity
+        Observation to predict.
+    predict : function
+        Maps the full input field to a dict of outputs, e.g. as returned by
+        `dl4mir.chords.models.dense_predictor`.
+    input_key : str
+        Name of the field to use for the input.
+
+    Returns
+    -------
+    output : biggie.Entity
+        Entity with the input field replaced by the outputs.
+    """
+    values = entity.values()
+    values.update(predict(np.asarray(values.pop(input_key))))
+    return biggie.Entity(**values)
+
+
+def process_stash(stash, transform, output, input_key, verbose=False,
+                  predict=None):
     """Apply an optimus transform to all the entities in a stash, producing a
     separate output stash.
 
@@ -610,10 +870,17 @@ def process_stash(stash, transform, output, input_key, verbose=False):
         Stash for writing outputs.
     input_key : str
         Name of the field to use for the input.
+    predict : function, default=None
+        Whole-track version of `transform`; if given, it is applied to each
+        entity via `predict_entity` instead of `convolve`.
     """
     total_count = len(stash.keys())
     for idx, key in enumerate(stash.keys()):
-        output.add(key, convolve(stash.get(key), transform, input_key))
+        if predict is None:
+            entity = convolve(stash.get(key), transform, input_key)
+        else:
+            entity = predict_entity(stash.get(key), predict, input_key)
+        output.add(key, entity)
         if verbose:
             print("[{0}] {1:7} / {2:7}: {3}".format(
                   time.asctime(), idx, total_count, key))
@@ -0,0 +1,772 @@
+"""Log-domain Viterbi decoding."""
+
+from collections import deque
+import numpy as np
+import scipy.sparse
+
+from .util import penalty_structure
+
+
+def log_transitions(num_states, transition_matrix=None, penalty=0):
+    """Build a penalized transition matrix in the log domain.
+
+    This matches the transitions used by `util.viterbi`, i.e. the off-diagonal
+    elements are scaled by `exp(penalty)`, but the penalty is added in the log
+    domain so that large penalties do not underflow.
+
+    Parameters
+    ----------
+    num_states : int
+        Number of states in the model.
+    transition_matrix: np.ndarray, shape=(num_states, num_states)
+        Transition matrix for the viterbi algorithm; if None, uniform.
+    penalty: scalar, default=0
+        Scalar penalty to down-weight off-diagonal states.
+
+    Returns
+    -------
+    log_trans : np.ndarray, shape=(num_states, num_states)
+        Log-transition matrix.
+    """
+    if transition_matrix is None:
+        transition_matrix = np.ones([num_states]*2)
+    offset = 1.0 - np.eye(num_states)
+    return safe_log(transition_matrix) + offset * penalty
+
+
+def safe_log(x):
+    """Logarithm that maps zero to -inf without warning."""
+    with np.errstate(divide='ignore'):
+        return np.log(x)
+
+
+def index_dtype(num_states):
+    """Return the smallest integer type that can index `num_states`."""
+    if num_states <= np.iinfo(np.int16).max + 1:
+        return np.int16
+    return np.int32
+
+
+class ViterbiDecoder(object):
+    """Viterbi decoder operating in the log domain.
+
+    The log-transitions are computed once at construction, and the working
+    buffers are kept between calls to `decode`, such that only the
+    backpointers grow with the length of the input. Backpointers are stored
+    as the smallest integer type able to index the states.
+
+    Parameters
+    ----------
+    num_states : int
+        Number of states in the model.
+    transition_matrix: np.ndarray, shape=(num_states, num_states)
+        Transition matrix, with the same convention as `util.viterbi`.
+    prior: np.ndarray, default=None (uniform)
+        Probability distribution over the states.
+    penalty: scalar, default=0
+        Scalar penalty to down-weight off-diagonal states.
+    dtype : type, default=np.float64
+        Floating point precision for the path scores; np.float32 halves the
+        memory traffic.
+    """
+
+    def __init__(self, num_states, transition_matrix=None, prior=None,
+                 penalty=0, dtype=np.float64):
+        self.num_states = int(num_states)
+        self.penalty = penalty
+        self.dtype = np.dtype(dtype)
+        self.log_transitions = log_transitions(
+            num_states, transition_matrix, penalty).astype(self.dtype)
+        if prior is None:
+            prior = np.ones(num_states) / float(num_states)
+        self.log_prior = safe_log(prior).astype(self.dtype)
+        self.structure = penalty_structure(self.log_transitions)
+        self.psi_dtype = index_dtype(num_states)
+
+        self._states = np.arange(num_states)
+        self._delta = np.empty(num_states, dtype=self.dtype)
+        self._scores = np.empty(num_states, dtype=self.dtype)
+        self._mask = np.empty(num_states, dtype=bool)
+        self._argmax = np.empty(num_states, dtype=np.intp)
+        self._res = None
+        if self.structure is None:
+            self._res = np.empty([num_states]*2, dtype=self.dtype)
+        self._psi = np.empty([0, num_states], dtype=self.psi_dtype)
+
+    def _observe(self, frame):
+        """Add the log-likelihood of an observation to the path scores, and
+        rescale such that the best path scores zero."""
+        np.log(frame, out=self._scores)
+        self._delta += self._scores
+        best = self._delta.max()
+        if np.isfinite(best):
+            self._delta -= best
+
+    def _step(self, psi_row):
+        """Advance the path scores one step, in-place, writing the best
+        predecessor for each state to `psi_row`."""
+        delta = self._delta
+        if self.structure is None:
+            np.add(self.log_transitions, delta, out=self._res)
+            self._res.argmax(axis=1, out=self._argmax)
+            self._res.max(axis=1, out=delta)
+            psi_row[:] = self._argmax
+            return
+
+        self_weight, other_weight = self.structure
+        other = self._scores
+        np.add(delta, other_weight, out=other)
+        first = other.argmax()
+        top = other[first]
+        other[first] = -np.inf
+        second = other.argmax()
+        runner_up = other[second]
+
+        # Every state but `first` competes against the overall best.
+        delta += self_weight
+        self_first = delta[first]
+        psi_row[:] = self._states
+        np.greater(top, delta, out=self._mask)
+        psi_row[self._mask] = first
+        np.equal(top, delta, out=self._mask)
+        self._mask[:first] = False
+        psi_row[self._mask] = first
+        np.maximum(delta, top, out=delta)
+
+        # The state holding the best score competes against the runner-up.
+        if runner_up > self_first:
+            psi_row[first], delta[first] = second, runner_up
+        elif runner_up == self_first:
+            psi_row[first], delta[first] = min(first, second), self_first
+        else:
+            psi_row[first], delta[first] = first, self_first
+
+    def decode(self, posterior):
+        """Find the optimal Viterbi path through a posteriorgram.
+
+        Parameters
+        ----------
+        posterior: np.ndarray, shape=(num_obs, num_states)
+            Matrix of observations by the number of states.
+
+        Returns
+        -------
+        path: np.ndarray, shape=(num_obs,)
+            Optimal state indices through the posterior.
+        """
+        num_obs, num_states = posterior.shape
+        if num_states != self.num_states:
+            raise ValueError("Expected {0} states, received {1}.".format(
+                self.num_states, num_states))
+        if self._psi.shape[0] < num_obs:
+            self._psi = np.empty([num_obs, num_states], dtype=self.psi_dtype)
+        psi = self._psi
+
+        self._delta[:] = self.log_prior
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._observe(posterior[0])
+            for idx in range(1, num_obs):
+                self._step(psi[idx])
+                self._observe(posterior[idx])
+
+        path = np.zeros(num_obs, dtype=int)
+        path[-1] = np.argmax(self._delta)
+        for idx in range(num_obs - 2, -1, -1):
+            path[idx] = psi[idx + 1, path[idx + 1]]
+        return path
+
+
+class StreamingViterbi(ViterbiDecoder):
+    """Online Viterbi decoder, emitting states as they become final.
+
+    Frames are pushed one at a time. States are committed as soon as all
+    survivor paths agree on them, which is exactly the offline result, or
+    once they fall more than `max_lag` frames behind the newest frame, in
+    which case the currently best path is used. Only the backpointers of
+    uncommitted frames are kept, so memory is bounded by `max_lag`.
+
+    Parameters
+    ----------
+    num_states : int
+        Number of states in the model.
+    transition_matrix: np.ndarray, shape=(num_states, num_states)
+        Transition matrix, with the same convention as `util.viterbi`.
+    prior: np.ndarray, default=None (uniform)
+        Probability distribution over the states.
+    penalty: scalar, default=0
+        Scalar penalty to down-weight off-diagonal states.
+    max_lag : int, default=100
+        Maximum number of uncommitted frames; if None, states are only
+        committed when the survivors converge, or on `flush`.
+    dtype : type, default=np.float64
+        Floating point precision for the path scores.
+    """
+
+    def __init__(self, num_states, transition_matrix=None, prior=None,
+                 penalty=0, max_lag=100, dtype=np.float64):
+        ViterbiDecoder.__init__(self, num_states, transition_matrix, prior,
+                                penalty, dtype)
+        self.max_lag = max_lag
+        self.reset()
+
+    def reset(self):
+        """Discard all uncommitted frames and start a new sequence."""
+        self._delta[:] = self.log_prior
+        self._rows = deque()
+        self._ancestors = self._states
+        self._start = 0
+        self._count = 0
+
+    @property
+    def lag(self):
+        """Number of frames pushed, but not yet committed."""
+        return self._count - self._start
+
+    def _commit(self, last_idx, state):
+        """Commit all pending frames through `last_idx`, given its state."""
+        num_frames = last_idx - self._start + 1
+        path = np.zeros(num_frames, dtype=int)
+        path[-1] = state
+        for idx in range(num_frames - 2, -1, -1):
+            path[idx] = self._rows[idx][path[idx + 1]]
+        for _ in range(min(num_frames, len(self._rows))):
+            self._rows.popleft()
+        self._start = last_idx + 1
+        return path
+
+    def _trace(self, last_idx):
+        """Trace every current state back to frame `last_idx`.
+
+        Returns
+        -------
+        survivors : np.ndarray, shape=(num_states,)
+            Ancestor at `last_idx` of each state at the newest frame.
+        """
+        survivors = self._states
+        for idx in range(self._count - 1, last_idx, -1):
+            survivors = self._rows[idx - self._start - 1][survivors]
+        return survivors
+
+    def _converge(self):
+        """Commit all frames on which the survivors agree, if any."""
+        if self._ancestors.min() != self._ancestors.max():
+            return np.zeros(0, dtype=int)
+
+        # Walk back from the newest frame to the latest point of agreement.
+        survivors, last_idx = self._states, self._count - 1
+        previous = survivors
+        while survivors.min() != survivors.max():
+            previous = survivors
+            survivors = self._rows[last_idx - self._start - 1][survivors]
+            last_idx -= 1
+        path = self._commit(last_idx, survivors[0])
+        self._ancestors = previous
+        return path
+
+    def push(self, frame):
+        """Add an observation and return any newly committed states.
+
+        Parameters
+        ----------
+        frame : np.ndarray, shape=(num_states,)
+            Posterior of the next observation.
+
+        Returns
+        -------
+        states : np.ndarray
+            State indices of the newly committed frames, in order; possibly
+            empty.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.lag:
+                row = np.empty(self.num_states, dtype=self.psi_dtype)
+                self._step(row)
+                self._rows.append(row)
+                self._ancestors = self._ancestors[row]
+            else:
+                self._ancestors = self._states
+            self._observe(frame)
+        self._count += 1
+
+        committed = [self._converge()]
+        if self.max_lag is not None and self.lag > self.max_lag:
+            last_idx = self._count - self.max_lag - 1
+            survivors = self._trace(last_idx)
+            committed.append(
+                self._commit(last_idx, survivors[np.argmax(self._delta)]))
+            self._ancestors = self._trace(self._start)
+        return np.concatenate(committed)
+
+    def flush(self):
+        """Commit all pending frames along the best path, and reset.
+
+        Returns
+        -------
+        states : np.ndarray
+            State indices of the remaining frames, in order.
+        """
+        path = np.zeros(0, dtype=int)
+        if self.lag:
+            path = self._commit(self._count - 1, np.argmax(self._delta))
+        self.reset()
+        return path
+
+
+def log_viterbi(posterior, transition_matrix=None, prior=None, penalty=0,
+                dtype=np.float64):
+    """Find the optimal Viterbi path through a posteriorgram in the log domain.
+
+    Parameters
+    ----------
+    posterior: np.ndarray, shape=(num_obs, num_states)
+        Matrix of observations by the number of states.
+    transition_matrix: np.ndarray, shape=(num_states, num_states)
+        Transition matrix, with the same convention as `util.viterbi`.
+    prior: np.ndarray, default=None (uniform)
+        Probability distribution over the states.
+    penalty: scalar, default=0
+        Scalar penalty to down-weight off-diagonal states.
+    dtype : type, default=np.float64
+        Floating point precision for the path scores.
+
+    Returns
+    -------
+    path: np.ndarray, shape=(num_obs,)
+        Optimal state indices through the posterior.
+    """
+    decoder = ViterbiDecoder(posterior.shape[1], transition_matrix, prior,
+                             penalty, dtype)
+    return decoder.decode(posterior)
+
+
+def _observe(delta, log_obs):
+    """Add log-observations to a stack of path scores, in-place, and rescale
+    each chain such that its best path scores zero."""
+    delta += log_obs
+    best = delta.max(axis=1).reshape(-1, 1)
+    delta -= np.where(np.isfinite(best), best, 0)
+
+
+def _structured_step(delta, self_weight, other_weight):
+    """Max-sum step over a stack of independent chains, for log-transitions
+    of the form `self_weight * I + other_weight * (1 - I)`.
+
+    Parameters
+    ----------
+    delta : np.ndarray, shape=(num_chains, num_states)
+        Path scores at the previous step.
+    self_weight : scalar, or np.ndarray, shape=(num_chains, 1)
+        Log-weight of staying in the same state.
+    other_weight : scalar, or np.ndarray, shape=(num_chains, 1)
+        Log-weight of moving to any other state.
+
+    Returns
+    -------
+    values : np.ndarray, shape=(num_chains, num_states)
+        Best incoming score for each state.
+    indices : np.ndarray, shape=(num_chains, num_states)
+        Index of the best predecessor for each state, with the first-index
+        tie-breaking of a dense argmax.
+    """
+    num_chains, num_states = delta.shape
+    chains = np.arange(num_chains)
+    states = np.arange(num_states).reshape(1, -1)
+    self_res = delta + self_weight
+    other_res = delta + other_weight
+
+    first = other_res.argmax(axis=1)
+    top = other_res[chains, first]
+    other_res[chains, first] = -np.inf
+    second = other_res.argmax(axis=1)
+    runner_up = other_res[chains, second]
+
+    is_first = states == first.reshape(-1, 1)
+    best_other = np.where(is_first, second.reshape(-1, 1),
+                          first.reshape(-1, 1))
+    other_max = np.where(is_first, runner_up.reshape(-1, 1),
+                         top.reshape(-1, 1))
+
+    values = np.maximum(self_res, other_max)
+    indices = np.where(other_max > self_res, best_other, states)
+    ties = other_max == self_res
+    indices[ties] = np.minimum(states, best_other)[ties]
+    return values, indices
+
+
+def _dense_step(delta, log_trans):
+    """Max-sum step over a stack of independent chains.
+
+    Parameters
+    ----------
+    delta : np.ndarray, shape=(num_chains, num_states)
+        Path scores at the previous step.
+    log_trans : np.ndarray, shape=([num_chains,] num_states, num_states)
+        Log-transitions, shared or per chain.
+
+    Returns
+    -------
+    values, indices : np.ndarray, shape=(num_chains, num_states)
+        Best incoming score and predecessor for each state.
+    """
+    res = log_trans + delta[:, np.newaxis, :]
+    indices = res.argmax(axis=2)
+    return res.max(axis=2), indices
+
+
+def _backtrace(psi, last_states, lengths=None):
+    """Follow backpointers for a stack of chains.
+
+    Parameters
+    ----------
+    psi : np.ndarray, shape=(num_obs, num_chains, num_states)
+        Backpointers; psi[t] maps states at t to their predecessors at t - 1.
+    last_states : np.ndarray, shape=(num_chains,)
+        State of each chain at its final step.
+    lengths : np.ndarray, shape=(num_chains,), default=None
+        Number of valid steps in each chain; if None, all chains span the
+        full `num_obs`. Values of a path beyond its length are undefined.
+
+    Returns
+    -------
+    paths : np.ndarray, shape=(num_chains, num_obs)
+        State indices for each chain.
+    """
+    num_obs, num_chains = psi.shape[:2]
+    if lengths is None:
+        lengths = np.zeros(num_chains, dtype=int) + num_obs
+    chains = np.arange(num_chains)
+    paths = np.zeros([num_chains, num_obs], dtype=int)
+    states = np.asarray(last_states, dtype=int).copy()
+    paths[:, -1] = states
+    for idx in range(num_obs - 2, -1, -1):
+        active = (idx + 1) < lengths
+        states[active] = psi[idx + 1, chains, states][active]
+        paths[:, idx] = states
+    return paths
+
+
+def viterbi_penalties(posterior, penalties, transition_matrix=None,
+                      prior=None, dtype=np.float64):
+    """Decode a posteriorgram under several penalties in a single pass.
+
+    Each penalty is an independent row of a stacked (num_penalties,
+    num_states) dynamic program, such that the per-frame overhead is paid
+    once for the full sweep. Paths are identical to calling `log_viterbi`
+    once per penalty.
+
+    Parameters
+    ----------
+    posterior: np.ndarray, shape=(num_obs, num_states)
+        Matrix of observations by the number of states.
+    penalties : array_like, shape=(num_penalties,)
+        Penalties to down-weight off-diagonal states.
+    transition_matrix: np.ndarray, shape=(num_states, num_states)
+        Transition matrix, with the same convention as `util.viterbi`.
+    prior: np.ndarray, default=None (uniform)
+        Probability distribution over the states.
+    dtype : type, default=np.float64
+        Floating point precision for the path scores.
+
+    Returns
+    -------
+    paths: np.ndarray, shape=(num_penalties, num_obs)
+        Optimal state indices through the posterior, for each penalty.
+    """
+    num_obs, num_states = posterior.shape
+    penalties = np.asarray(penalties, dtype=dtype).reshape(-1, 1)
+    num_chains = len(penalties)
+
+    log_trans = log_transitions(num_states, transition_matrix).astype(dtype)
+    structure = penalty_structure(log_trans)
+    if structure is None:
+        offset = 1.0 - np.eye(num_states, dtype=dtype)
+        log_trans = log_trans + penalties[:, :, np.newaxis] * offset
+    else:
+        self_weight, other_weight = structure
+        other_weight = other_weight + penalties
+
+    if prior is None:
+        prior = np.ones(num_states) / float(num_states)
+    log_post = safe_log(np.asarray(posterior, dtype=dtype))
+
+    psi = np.zeros([num_obs, num_chains, num_states],
+                   dtype=index_dtype(num_states))
+    delta = np.zeros([num_chains, num_states], dtype=dtype)
+    delta += safe_log(prior)
+    with np.errstate(invalid='ignore'):
+        _observe(delta, log_post[0])
+        for idx in range(1, num_obs):
+            if structure is None:
+                delta, psi[idx] = _dense_step(delta, log_trans)
+            else:
+                delta, psi[idx] = _structured_step(
+                    delta, self_weight, other_weight)
+            _observe(delta, log_post[idx])
+
+    return _backtrace(psi, delta.argmax(axis=1))
+
+
+def pad_posteriors(posteriors, fill_value=1.0):
+    """Pack a collection of posteriorgrams into a padded tensor.
+
+    Parameters
+    ----------
+    posteriors : list of np.ndarrays, len=num_items
+        Posteriorgrams, each shaped (num_obs, num_states), of varying length.
+    fill_value : scalar, default=1.0
+        Value for the padded frames.
+
+    Returns
+    -------
+    padded : np.ndarray, shape=(num_items, max_num_obs, num_states)
+        Posteriorgrams, aligned at the first frame.
+    lengths : np.ndarray, shape=(num_items,)
+        Number of valid frames of each posteriorgram.
+    """
+    lengths = np.array([len(x) for x in posteriors], dtype=int)
+    num_states = posteriors[0].shape[1]
+    padded = np.zeros([len(posteriors), lengths.max(), num_states]) + \
+        fill_value
+    for idx, x in enumerate(posteriors):
+        padded[idx, :len(x)] = x
+    return padded, lengths
+
+
+def viterbi_batch(posteriors, transition_matrix=None, prior=None, penalty=0,
+                  dtype=np.float64):
+    """Decode several posteriorgrams of different lengths in lockstep.
+
+    The posteriorgrams are packed into a padded (num_items, max_num_obs,
+    num_states) tensor and advanced together, such that the per-frame
+    overhead is paid once per batch rather than once per item. Chains are
+    frozen once their length is exhausted. Paths are identical to calling
+    `log_viterbi` on each item.
+
+    Parameters
+    ----------
+    posteriors : list of np.ndarrays, len=num_items
+        Posteriorgrams, each shaped (num_obs, num_states).
+    transition_matrix: np.ndarray, shape=(num_states, num_states)
+        Transition matrix, with the same convention as `util.viterbi`.
+    prior: np.ndarray, default=None (uniform)
+        Probability distribution over the states.
+    penalty: scalar, default=0
+        Scalar penalty to down-weight off-diagonal states.
+    dtype : type, default=np.float64
+        Floating point precision for the path scores.
+
+    Returns
+    -------
+    paths : list of np.ndarrays, len=num_items
+        Optimal state indices through each posterior.
+    """
+    padded, lengths = pad_posteriors(posteriors)
+    num_items, max_num_obs, num_states = padded.shape
+
+    log_trans = log_transitions(
+        num_states, transition_matrix, penalty).astype(dtype)
+    structure = penalty_structure(log_trans)
+    if prior is None:
+        prior = np.ones(num_states) / float(num_states)
+    log_post = safe_log(padded.astype(dtype)).transpose(1, 0, 2)
+
+    psi = np.zeros([max_num_obs, num_items, num_states],
+                   dtype=index_dtype(num_states))
+    delta = np.zeros([num_items, num_states], dtype=dtype)
+    delta += safe_log(prior)
+    with np.errstate(invalid='ignore'):
+        _observe(delta, log_post[0])
+        for idx in range(1, max_num_obs):
+            if structure is None:
+                values, psi[idx] = _dense_step(delta, log_trans)
+            else:
+                values, psi[idx] = _structured_step(delta, *structure)
+            active = (idx < lengths).reshape(-1, 1)
+            delta = np.where(active, values, delta)
+            _observe(delta, log_post[idx])
+
+    paths = _backtrace(psi, delta.argmax(axis=1), lengths)
+    return [path[:num_obs] for path, num_obs in zip(paths, lengths)]
+
+
+def sparse_log_transitions(transition_matrix, penalty=0, dtype=np.float64):
+    """Build penalized log-transitions in compressed sparse column form.
+
+    Only the nonzero transitions are represented; all others are impossible.
+
+    Parameters
+    ----------
+    transition_matrix: np.ndarray or scipy.sparse matrix
+        Transition matrix, shaped (num_states, num_states), with the same
+        convention as `util.viterbi`, i.e. element [j, i] weights a move
+        from state i to state j.
+    penalty: scalar, default=0
+        Scalar penalty to down-weight off-diagonal states.
+    dtype : type, default=np.float64
+        Floating point precision of the weights.
+
+    Returns
+    -------
+    indptr : np.ndarray, shape=(num_states + 1,)
+        Transitions out of state i are stored in [indptr[i], indptr[i + 1]).
+    indices : np.ndarray
+        Destination state of each transition.
+    log_weights : np.ndarray
+        Penalized log-weight of each transition.
+    """
+    trans = scipy.sparse.csc_matrix(transition_matrix, dtype=float)
+    trans.eliminate_zeros()
+    trans.sort_indices()
+    sources = np.repeat(np.arange(trans.shape[1]), np.diff(trans.indptr))
+    log_weights = np.log(trans.data) + penalty * (trans.indices != sources)
+    return trans.indptr, trans.indices, log_weights.astype(dtype)
+
+
+def _prune(delta, beam_width=None, threshold=None):
+    """Select the states that survive beam pruning, in ascending order.
+
+    Parameters
+    ----------
+    delta : np.ndarray, shape=(num_states,)
+        Path scores.
+    beam_width : int, default=None
+        Maximum number of states to keep.
+    threshold : scalar, default=None
+        Keep only states scoring within `threshold` of the best.
+
+    Returns
+    -------
+    active : np.ndarray
+        Indices of the surviving states.
+    """
+    active = np.flatnonzero(np.isfinite(delta))
+    if threshold is not None and len(active):
+        active = active[delta[active] >= delta[active].max() - threshold]
+    if beam_width is not None and len(active) > beam_width:
+        top = np.argpartition(delta[active], len(active) - beam_width)
+        active = np.sort(active[top[-beam_width:]])
+    return active
+
+
+def _sparse_step(delta, active, indptr, indices, log_weights):
+    """Max-sum step from a subset of active states over sparse transitions.
+
+    Parameters
+    ----------
+    delta : np.ndarray, shape=(num_states,)
+        Path scores at the previous step.
+    active : np.ndarray
+        Indices of the states to expand, in ascending order.
+    indptr, indices, log_weights : np.ndarrays
+        Sparse log-transitions, as returned by `sparse_log_transitions`.
+
+    Returns
+    -------
+    values : np.ndarray, shape=(num_states,)
+        Best incoming score for each state; -inf where unreachable.
+    predecessors : np.ndarray, shape=(num_states,)
+        Best predecessor for each state, preferring the lowest index on ties;
+        zero where unreachable.
+    """
+    num_states = len(delta)
+    values = np.zeros(num_states, dtype=delta.dtype) - np.inf
+    predecessors = np.zeros(num_states, dtype=int)
+    counts = indptr[active + 1] - indptr[active]
+    num_edges = counts.sum()
+    if num_edges == 0:
+        return values, predecessors
+
+    offsets = np.repeat(indptr[active] - np.cumsum(counts) + counts, counts)
+    edges = offsets + np.arange(num_edges)
+    # Group the expanded edges by target; the stable sort keeps the sources
+    # of each target in ascending order.
+    order = np.argsort(indices[edges], kind='mergesort')
+    edges = edges[order]
+    sources = np.repeat(active, counts)[order]
+    targets = indices[edges]
+    scores = delta[sources] + log_weights[edges]
+
+    starts = np.flatnonzero(np.diff(targets)) + 1
+    starts = np.concatenate([[0], starts])
+    reached = targets[starts]
+    values[reached] = np.maximum.reduceat(scores, starts)
+    # First (lowest source) edge attaining the maximum of each segment.
+    positions = np.where(scores == values[targets], np.arange(num_edges),
+                         num_edges)
+    predecessors[reached] = sources[np.minimum.reduceat(positions, starts)]
+    return values, predecessors
+
+
+def viterbi_beam(posterior, transition_matrix, prior=None, penalty=0,
+                 beam_width=None, threshold=None, dtype=np.float64,
+                 return_stats=False):
+    """Find the Viterbi path through a large, sparsely connected state space,
+    optionally pruning unlikely states at every step.
+
+    Each step only expands the surviving states along their nonzero
+    transitions, so the cost scales with the beam rather than the square of
+    the number of states; `beam_width` bounds the worst case. Without
+    pruning, the path is identical to `log_viterbi`.
+
+    Parameters
+    ----------
+    posterior: np.ndarray, shape=(num_obs, num_states)
+        Matrix of observations by the number of states.
+    transition_matrix: np.ndarray or scipy.sparse matrix
+        Transition matrix, shaped (num_states, num_states), with the same
+        convention as `util.viterbi`; zeros are impossible transitions.
+    prior: np.ndarray, default=None (uniform)
+        Probability distribution over the states.
+    penalty: scalar, default=0
+        Scalar penalty to down-weight off-diagonal states.
+    beam_width : int, default=None
+        Maximum number of states to expand at each step.
+    threshold : scalar, default=None
+        Only expand states whose log-score is within `threshold` of the best.
+    dtype : type, default=np.float64
+        Floating point precision for the path scores.
+    return_stats : bool, default=False
+        If True, also return pruning statistics.
+
+    Returns
+    -------
+    path: np.ndarray, shape=(num_obs,)
+        State indices through the posterior.
+    stats : dict, optional
+        Pruning statistics, with keys {pruning_rate, mean_active,
+        max_active}; the pruning rate is the fraction of finite-scoring
+        states that were not expanded.
+    """
+    num_obs, num_states = posterior.shape
+    indptr, indices, log_weights = sparse_log_transitions(
+        transition_matrix, penalty, dtype)
+    if prior is None:
+        prior = np.ones(num_states) / float(num_states)
+
+    psi = np.zeros([num_obs, num_states], dtype=index_dtype(num_states))
+    delta = safe_log(prior).astype(dtype)
+    delta += safe_log(posterior[0])
+    delta -= delta.max() if np.isfinite(delta.max()) else 0
+    num_active, num_finite, max_active = 0, 0, 0
+    with np.errstate(invalid='ignore'):
+        for idx in range(1, num_obs):
+            active = _prune(delta, beam_width, threshold)
+            num_active += len(active)
+            num_finite += np.isfinite(delta).sum()
+            max_active = max(max_active, len(active))
+            delta, psi[idx] = _sparse_step(
+                delta, active, indptr, indices, log_weights)
+            delta += safe_log(posterior[idx])
+            best = delta.max()
+            if np.isfinite(best):
+                delta -= best
+
+    path = _backtrace(psi[:, np.newaxis, :], [np.argmax(delta)])[0]
+    if not return_stats:
+        return path
+    num_steps = max(num_obs - 1, 1)
+    stats = dict(
+        pruning_rate=1.0 - num_active / float(max(num_finite, 1)),
+        mean_active=num_active / float(num_steps),
+        max_active=max_active)
+    return path, stats
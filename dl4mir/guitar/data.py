@@ -33,7 +33,7 @@ def cqt_sampler(key, stash, win_length=20, index=None, max_samples=None,
     sample: biggie.Entity with fields {cqt, chord_label}
         The windowed chord observation.
     """
-    entity = stash.get(key)
+    entity = util.pad_cqt_entity(stash.get(key), win_length)
     num_samples = len(entity.chord_labels)
 
     if index is None:
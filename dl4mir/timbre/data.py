@@ -7,6 +7,7 @@ import pescador
 import time
 
 from dl4mir.common import util
+from dl4mir.common import featurestore as fstore
 from dl4mir.common import fileutil as futil
 
 
@@ -16,7 +17,8 @@ def create_entity(npz_file, dtype=np.float32):
     Parameters
     ----------
     npz_file: str
-        Path to a 'npz' archive, containing at least a value for 'cqt'.
+        Path to a feature file ('npz' archive or memory-mappable 'npyd'
+        directory), containing at least a value for 'cqt'.
     dtype: type
         Data type for the cqt array.
 
@@ -29,8 +31,8 @@ def create_entity(npz_file, dtype=np.float32):
     (icode, note_number,
         fcode) = [np.array(_) for _ in futil.filebase(npz_file).split('_')]
     entity = biggie.Entity(icode=icode, note_number=note_number,
-                           fcode=fcode, **np.load(npz_file))
-    entity.cqt = entity.cqt.astype(dtype)
+                           fcode=fcode, **fstore.load(npz_file))
+    entity.cqt = np.asarray(entity.cqt, dtype=dtype)
     return entity
 
 
@@ -53,7 +55,7 @@ def slice_cqt_entity(entity, length, idx=None):
         The windowed observation.
     """
     idx = np.random.randint(entity.cqt.shape[1]) if idx is None else idx
-    cqt = np.array([util.slice_tile(x, idx, length) for x in entity.cqt])
+    cqt = util.cqt_tile(entity, idx, length)
     return biggie.Entity(cqt=cqt, label=entity.icode)
 
 
@@ -109,7 +111,7 @@ def cqt_sampler(key, stash, win_length=20, max_samples=None,
     sample: biggie.Entity with fields {cqt, label}
         The windowed observation.
     """
-    entity = stash.get(key)
+    entity = util.pad_cqt_entity(stash.get(key), win_length)
     num_samples = len(entity.time_points)
     valid_samples = np.arange(num_samples)
     if threshold is not None:
@@ -16,14 +16,17 @@ import numpy as np
 import os
 import time
 
+from dl4mir.common import featurestore as fstore
 from dl4mir.common import fileutil as futil
 from dl4mir.common.lcn import lcn_octaves as lcn
 from dl4mir.common.lcn import create_kernel
 
 # Globals
 KERNEL = 'kernel'
+DTYPE = 'dtype'
 PARAMS = dict()
-EXT = ".npz"
+EXT = "npz"
+MANIFEST = "lcn_manifest.json"
 
 
 def apply_lcn(file_pair, key='cqt'):
@@ -38,27 +41,29 @@ def apply_lcn(file_pair, key='cqt'):
     -------
     Nothing, but the output file is written in this call.
     """
-    data = dict(**np.load(file_pair.first))
-    if data[key].ndim == 2:
-        data[key] = lcn(data[key], PARAMS[KERNEL])
-    elif data[key].ndim == 3:
-        data[key] = np.array([lcn(x, PARAMS[KERNEL])
-                              for x in data[key]])
-    else:
+    data = fstore.load(file_pair.first)
+    if data[key].ndim not in (2, 3):
         raise ValueError(
             "Cannot transform a {}-dim array.".format(data[key].ndim))
+    # All channels are normalized in a single call.
+    data[key] = lcn(np.asarray(data[key], dtype=PARAMS[DTYPE]),
+                    PARAMS[KERNEL])
     print("[{0}] Finished: {1}".format(time.asctime(), file_pair.first))
-    np.savez(file_pair.second, **data)
+    fstore.save(file_pair.second, **data)
     return True
 
 
-def main(textlist, dim0, dim1, output_directory, param_file, num_cpus=-1):
+def main(textlist, dim0, dim1, output_directory, param_file, num_cpus=-1,
+         use_hash=False, output_format=EXT, dtype='float32'):
     """Apply Local Contrast Normalization to a collection of files.
 
+    Files that are up to date, according to the manifest in the output
+    directory, are skipped.
+
     Parameters
     ----------
     textlist : str
-        A text list of npz filepaths.
+        A text list of feature filepaths (npz or npyd).
     dim0 : int
         First dimension of the filter kernel (time).
     dim1 : int
@@ -69,18 +74,30 @@ def main(textlist, dim0, dim1, output_directory, param_file, num_cpus=-1):
         Directory to save the parameters used.
     num_cpus : int, default=-1
         Number of CPUs over which to parallelize computations.
+    use_hash : bool, default=False
+        Detect changed inputs by their contents, rather than their
+        modification times.
+    output_format : str, default='npz'
+        Write npz archives, or memory-mappable directories of .npy files
+        ('npyd').
+    dtype : str, default='float32'
+        Floating point type in which to compute, and save, the output.
     """
     # Set the kernel globally.
     PARAMS[KERNEL] = create_kernel(dim0, dim1)
+    PARAMS[DTYPE] = np.dtype(dtype)
+    params = dict(dim0=dim0, dim1=dim1, dtype=dtype)
 
     output_dir = futil.create_directory(output_directory)
     with open(os.path.join(output_dir, param_file), "w") as fp:
-        json.dump({"dim0": dim0, "dim1": dim1}, fp, indent=2)
+        json.dump(params, fp, indent=2)
 
     pool = Parallel(n_jobs=num_cpus)
     dlcn = delayed(apply_lcn)
-    iterargs = futil.map_path_file_to_dir(textlist, output_dir, EXT)
-    return pool(dlcn(x) for x in iterargs)
+    iterargs = futil.map_path_file_to_dir(textlist, output_dir, output_format)
+    return futil.run_incremental(
+        dlcn, iterargs, params,
+        os.path.join(output_dir, MANIFEST), pool, use_hash=use_hash)
 
 
 if __name__ == "__main__":
@@ -104,6 +121,17 @@ if __name__ == "__main__":
                         metavar="num_cpus", default=-1,
                         help="Number of CPUs over which to parallelize "
                              "computations.")
+    parser.add_argument("--use_hash", action="store_true",
+                        help="Detect changed inputs by their contents, "
+                             "rather than their modification times.")
+    parser.add_argument("--output_format", type=str, default=EXT,
+                        choices=[fstore.NPZ_EXT, fstore.EXT],
+                        help="Write npz archives, or memory-mappable "
+                             "directories of .npy files.")
+    parser.add_argument("--dtype", type=str, default='float32',
+                        choices=['float32', 'float64'],
+                        help="Floating point type of the computation.")
     args = parser.parse_args()
     main(args.textlist, args.dim0, args.dim1, args.output_directory,
-         args.param_file, args.num_cpus)
+         args.param_file, args.num_cpus, args.use_hash, args.output_format,
+         args.dtype)
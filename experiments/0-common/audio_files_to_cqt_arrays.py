@@ -17,16 +17,29 @@ params = {"q": 0.75,
           "bins_per_octave": 24,
           "framerate": 20,
           "alignment": 'center',
-          "channels": 1}
+          "channels": 1,
+          "cascade": False}
 print json.dumps(params, indent=2)
 fh = open("cqt_params.txt", "w")
 json.dump(params, fh, indent=2)
 fh.close()
 
+Setting "cascade" decodes each file once and decimates it in memory, which is
+faster, but its features differ slightly from the default, per-octave
+resampling; they are not interchangeable with arrays or stashes computed
+without it. With "cascade", a "block_size" (e.g. 65536) streams each file
+through the CQT in blocks of that many samples, rather than decoding it whole.
+
 This script writes the output files under the given output directory:
 
   "/some/audio/file.mp3" maps to "${output_dir}/file.npz"
 
+or, with --output_format=npyd, to a memory-mappable directory of .npy files,
+"${output_dir}/file.npyd"; see dl4mir.common.featurestore.
+
+along with a manifest of the inputs processed, so that files which are up to
+date are skipped when the script is run again.
+
 Sample Call:
 $ python audio_files_to_cqt_arrays.py \
 rwc_filelist.txt \
@@ -40,18 +53,26 @@ import argparse
 from joblib import delayed
 from joblib import Parallel
 import json
-import numpy as np
+import os
 import time
 
 from dl4mir.common.cqt import cqt
+from dl4mir.common.cqt import octave_kernel
+from dl4mir.common.cqt import sparsify_kernel
+import dl4mir.common.featurestore as fstore
 import dl4mir.common.fileutil as futil
 
-EXT = ".npz"
+EXT = "npz"
+MANIFEST = "cqt_manifest.json"
 DEFAULT_PARAMS = dict(
     filepath=None, q=1.0, freq_min=27.5, octaves=7, bins_per_octave=36,
     samplerate=11025.0, channels=1, bytedepth=2, framerate=20.0,
     overlap=None, stride=None, time_points=None, alignment='center',
-    offset=0)
+    offset=0, cascade=False, chunk_size=None, sparse_threshold=None,
+    kernel_dir=None, block_size=None)
+KERNEL_PARAMS = ['q', 'freq_min', 'octaves', 'samplerate', 'bins_per_octave']
+# Parameters that don't change the output.
+RUNTIME_PARAMS = ['filepath', 'chunk_size', 'kernel_dir', 'block_size']
 
 
 def audio_file_to_cqt(file_pair):
@@ -70,20 +91,36 @@ def audio_file_to_cqt(file_pair):
     kwargs = dict(**DEFAULT_PARAMS)
     kwargs.update(filepath=file_pair.first)
     time_points, cqt_spectra = cqt(**kwargs)
-    np.savez(file_pair.second, time_points=time_points, cqt=cqt_spectra)
+    fstore.save(file_pair.second, time_points=time_points, cqt=cqt_spectra)
     print("[{0}] Finished: {1}".format(time.asctime(), file_pair.first))
     return True
 
 
-def main(textlist, output_directory, cqt_params=None, num_cpus=-1):
+def main(textlist, output_directory, cqt_params=None, num_cpus=-1,
+         use_hash=False, output_format=EXT):
     if cqt_params:
         DEFAULT_PARAMS.update(json.load(open(cqt_params)))
 
     output_dir = futil.create_directory(output_directory)
+    if DEFAULT_PARAMS['kernel_dir'] is None:
+        DEFAULT_PARAMS['kernel_dir'] = futil.create_directory(
+            os.path.join(output_dir, ".kernels"))
+
+    # Build the kernel once, so workers can load it from the kernel_dir.
+    kernel = octave_kernel(*[DEFAULT_PARAMS[k] for k in KERNEL_PARAMS],
+                           kernel_dir=DEFAULT_PARAMS['kernel_dir'])
+    if DEFAULT_PARAMS['sparse_threshold'] is not None:
+        error = sparsify_kernel(kernel, DEFAULT_PARAMS['sparse_threshold'])[1]
+        print("Sparse kernel reconstruction error: {0:0.4}".format(error))
+
     pool = Parallel(n_jobs=num_cpus)
     dcqt = delayed(audio_file_to_cqt)
-    iterargs = futil.map_path_file_to_dir(textlist, output_dir, EXT)
-    return pool(dcqt(x) for x in iterargs)
+    iterargs = futil.map_path_file_to_dir(textlist, output_dir, output_format)
+    params = dict([(k, v) for k, v in DEFAULT_PARAMS.items()
+                   if k not in RUNTIME_PARAMS])
+    return futil.run_incremental(
+        dcqt, iterargs, params, os.path.join(output_dir, MANIFEST), pool,
+        use_hash=use_hash)
 
 
 if __name__ == "__main__":
@@ -102,7 +139,14 @@ if __name__ == "__main__":
                         metavar="num_cpus", default=-1,
                         help="Number of CPUs over which to parallelize "
                              "computations.")
+    parser.add_argument("--use_hash", action="store_true",
+                        help="Detect changed inputs by their contents, "
+                             "rather than their modification times.")
+    parser.add_argument("--output_format", type=str, default=EXT,
+                        choices=[fstore.NPZ_EXT, fstore.EXT],
+                        help="Write npz archives, or memory-mappable "
+                             "directories of .npy files.")
 
     args = parser.parse_args()
     main(args.textlist, args.output_directory,
-         args.cqt_params, args.num_cpus)
+         args.cqt_params, args.num_cpus, args.use_hash, args.output_format)
@@ -5,17 +5,20 @@ import biggie
 import optimus
 import os
 
+import dl4mir.chords.models as models
 import dl4mir.common.fileutil as futil
 import dl4mir.common.util as util
 
 
 def main(stash_file, input_key, transform_file,
-         param_file, output_file, verbose=True):
+         param_file, output_file, verbose=True, dense=None):
     transform = optimus.load(transform_file, param_file)
+    predict = models.DENSE_PREDICTORS[dense](transform) if dense else None
     stash = biggie.Stash(stash_file)
     futil.create_directory(os.path.split(output_file)[0])
     output = biggie.Stash(output_file)
-    util.process_stash(stash, transform, output, input_key, verbose=verbose)
+    util.process_stash(stash, transform, output, input_key, verbose=verbose,
+                       predict=predict)
 
 
 if __name__ == "__main__":
@@ -38,6 +41,10 @@ if __name__ == "__main__":
     parser.add_argument("output_file",
                         metavar="output_file", type=str,
                         help="Path for the transformed output.")
+    parser.add_argument("--dense", type=str, default=None,
+                        choices=sorted(models.DENSE_PREDICTORS.keys()),
+                        help="If given, predict whole tracks at once with "
+                             "the dense version of this chord model.")
     args = parser.parse_args()
     main(args.stash_file, args.input_key, args.transform_file,
-         args.param_file, args.output_file)
+         args.param_file, args.output_file, dense=args.dense)
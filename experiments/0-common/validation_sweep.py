@@ -3,6 +3,7 @@ import biggie
 import optimus
 import os
 
+import dl4mir.chords.models as models
 import dl4mir.common.fileutil as futils
 from dl4mir.common import util
 
@@ -23,6 +24,9 @@ def main(args):
 
     for fidx, param_file in enumerate(param_files):
         transform.load_param_values(param_file)
+        # Dense predictors copy the parameter values, so rebuild each time.
+        predict = (models.DENSE_PREDICTORS[args.dense](transform)
+                   if args.dense else None)
         output_file = params_to_output_file(param_file, output_dir)
         futils.create_directory(os.path.split(output_file)[0])
         if os.path.exists(output_file):
@@ -30,7 +34,7 @@ def main(args):
 
         output = biggie.Stash(output_file)
         util.process_stash(stash, transform, output,
-                           args.field, verbose=args.verbose)
+                           args.field, verbose=args.verbose, predict=predict)
 
 
 if __name__ == "__main__":
@@ -59,6 +63,10 @@ if __name__ == "__main__":
     parser.add_argument("--stride",
                         metavar="--stride", type=int, default=1,
                         help="Parameter stride.")
+    parser.add_argument("--dense", type=str, default=None,
+                        choices=sorted(models.DENSE_PREDICTORS.keys()),
+                        help="If given, predict whole tracks at once with "
+                             "the dense version of this chord model.")
     parser.add_argument("--verbose",
                         action="store_true",
                         help="Provide console output.")
@@ -31,12 +31,13 @@ SPLIT_FILE=${META}/data_splits.json
 
 if [ -z "$1" ]; then
     echo "Usage:"
-    echo "build.sh {clean|cqt|lcn|labs|splits|biggie|all}"
+    echo "build.sh {clean|cqt|lcn|labs|splits|biggie|pipeline|all}"
     echo $'\tclean - Cleans the directory structure'
     echo $'\tcqt - Builds the CQTs'
     echo $'\tlcn - Applies LCN to the CQTs (assumes the exist)'
     echo $'\tsplits - Builds the json metadata files'
     echo $'\tbiggie - Builds biggie dataset files'
+    echo $'\tpipeline - Builds biggie files directly from audio (needs splits)'
     echo $'\tall - Do everything, in order'
     exit 0
 fi
@@ -107,6 +108,23 @@ ${BIGGIE}
 fi
 
 
+# -- Single-pass Biggie Files --
+if [ "$1" == "pipeline" ]; then
+    if [ -d ${BIGGIE} ]; then
+        rm -r ${BIGGIE}
+    fi
+    echo "Building the Biggie files from audio"
+    python ${SRC}/chords/build_stashes.py \
+${SPLIT_FILE} \
+${AUDIO} \
+${REFS} \
+${BIGGIE} \
+--audio_ext=${AUDIO_EXT} \
+--cqt_params=${CQT_PARAMS} \
+--lcn_dims ${LCN_DIM0} ${LCN_DIM1}
+fi
+
+
 if [ "$1" == "stats" ] || [ "$1" == "all" ]; then
     echo "Computing dataset statistics..."
     for ((idx=0; idx<NUM_FOLDS; idx++))